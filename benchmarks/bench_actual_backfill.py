@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+#
+# Benchmark get_knmi_data_actual_backfill() against a local stand-in for
+# the KNMI Open Data listing and download API, comparing serial download
+# and conversion with concurrent downloads and a process pool.
+#
+# Usage: python3 benchmarks/bench_actual_backfill.py [--hours 24]
+
+import argparse
+import datetime
+import logging
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import knmi2influxdb
+from fakeknmi import FakeOpenData
+
+def main():
+	parser = argparse.ArgumentParser(description="Benchmark actual data backfill")
+	parser.add_argument("--hours", type=int, default=24, help="Hours of 10-minute files to backfill")
+	parser.add_argument("--latency", type=float, default=0.05, help="Latency per API request (s)")
+	parser.add_argument("--workers", type=int, default=8, help="Concurrent downloads")
+	parser.add_argument("--processes", type=int, default=os.cpu_count(), help="Conversion processes")
+	args = parser.parse_args()
+
+	logging.raiseExceptions = False
+	day = datetime.datetime(2024, 5, 1, tzinfo=datetime.timezone.utc)
+	# Include files outside the range to check these are skipped
+	obstimes = [day + datetime.timedelta(minutes=10*i) for i in range(-6, args.hours*6 + 6)]
+	inrange = [t for t in obstimes if t.date() == day.date()]
+	histrange = (day.strftime("%Y%m%d"),)*2
+	query = 'weather,source=knmi{STN} temp={T},wind={FF},rain={RH} {DATETIME}'
+
+	with FakeOpenData(obstimes, latency=args.latency) as fake:
+		# Generate files up front, HDF5 is not thread-safe
+		for f in fake.files:
+			fake.nc(f)
+		knmi2influxdb.KNMIAPIURI = fake.uri
+
+		t0 = time.perf_counter()
+		serial = list(knmi2influxdb.get_knmi_data_actual_backfill('fake', 'all', query, histrange, workers=1, processes=0))
+		t_serial = time.perf_counter() - t0
+
+		t0 = time.perf_counter()
+		parallel = list(knmi2influxdb.get_knmi_data_actual_backfill('fake', 'all', query, histrange, workers=args.workers, processes=args.processes))
+		t_parallel = time.perf_counter() - t0
+
+	assert serial == parallel, "Parallel backfill gives different output"
+	times = [int(l.rsplit(' ', 1)[1]) for l in parallel]
+	assert times == sorted(times), "Output not ordered by time"
+	assert len(set(times)) == len(inrange), "Files missing or outside range"
+	print("files: {}, entries: {}".format(len(inrange), len(parallel)))
+	print("serial:   {:.2f}s ({:.0f} entries/s)".format(t_serial, len(serial)/t_serial))
+	print("parallel: {:.2f}s ({:.0f} entries/s), {} workers, {} processes".format(t_parallel, len(parallel)/t_parallel, args.workers, args.processes))
+	print("speedup:  {:.1f}x".format(t_serial/t_parallel))
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+#
+# Benchmark parallel windowed backfill get_knmi_data_historical_parallel()
+# versus a single get_knmi_data_historical() query, against a local fake
+# KNMI endpoint with latency and injected failures.
+#
+# Usage: python3 benchmarks/bench_backfill.py [--histrange 20150101 20171231]
+
+import argparse
+import logging
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import knmi2influxdb
+from fakeknmi import FakeKNMI
+from synthetic import WRAPPERQUERY
+
+def main():
+	parser = argparse.ArgumentParser(description="Benchmark parallel historical backfill")
+	parser.add_argument("--histrange", nargs=2, default=['20150101', '20171231'], help="Time range as YYYYMMDD YYYYMMDD")
+	parser.add_argument("--window", type=int, default=31, help="Window size in days")
+	parser.add_argument("--workers", type=int, default=8, help="Number of concurrent requests")
+	parser.add_argument("--latency", type=float, default=0.2, help="Fixed latency per request (s)")
+	parser.add_argument("--perday", type=float, default=0.005, help="Additional latency per requested day (s)")
+	parser.add_argument("--failures", type=int, default=2, help="Number of failed requests to inject in parallel run")
+	args = parser.parse_args()
+
+	logging.raiseExceptions = False
+	knmi2influxdb.RETRYBACKOFF = 0.1
+
+	with FakeKNMI(latency=args.latency, perday=args.perday) as fake:
+		knmi2influxdb.KNMIURI = fake.uri
+		t0 = time.perf_counter()
+		serial = knmi2influxdb.get_knmi_data_historical(260, args.histrange)
+		t_serial = time.perf_counter() - t0
+
+	with FakeKNMI(latency=args.latency, perday=args.perday, failures=args.failures) as fake:
+		knmi2influxdb.KNMIURI = fake.uri
+		t0 = time.perf_counter()
+		parallel = knmi2influxdb.get_knmi_data_historical_parallel(260, args.histrange, windowdays=args.window, workers=args.workers)
+		t_parallel = time.perf_counter() - t0
+		nrequests = fake.requests
+
+	assert knmi2influxdb.convert_knmi(serial, WRAPPERQUERY) == knmi2influxdb.convert_knmi(parallel, WRAPPERQUERY), "Parallel backfill gives different data"
+	print("single query:       {:.2f}s".format(t_serial))
+	print("parallel windows:   {:.2f}s ({} requests incl. {} failed)".format(t_parallel, nrequests, args.failures))
+	print("speedup:            {:.1f}x".format(t_serial/t_parallel))
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+#
+# Benchmark the historical data cache get_knmi_data_historical_cached()
+# for the daily cron job: get a sliding window of --days days for --runs
+# consecutive days, with and without cache, against a local fake KNMI
+# endpoint.
+#
+# Usage: python3 benchmarks/bench_histcache.py [--days 21 --runs 10]
+
+import argparse
+import datetime
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import knmi2influxdb
+from fakeknmi import FakeKNMI
+from synthetic import WRAPPERQUERY
+
+def main():
+	parser = argparse.ArgumentParser(description="Benchmark historical data cache")
+	parser.add_argument("--days", type=int, default=21, help="Days per run, like --histrange")
+	parser.add_argument("--runs", type=int, default=10, help="Number of daily runs")
+	parser.add_argument("--stations", type=int, default=2, help="Number of stations")
+	parser.add_argument("--latency", type=float, default=0.2, help="Fixed latency per request (s)")
+	parser.add_argument("--perday", type=float, default=0.01, help="Additional latency per requested day (s)")
+	args = parser.parse_args()
+
+	logging.raiseExceptions = False
+	stations = knmi2influxdb.KNMISTATIONS[:args.stations]
+	start = datetime.date(2020, 1, 1)
+	ranges = [((start + datetime.timedelta(days=r)).strftime("%Y%m%d"), (start + datetime.timedelta(days=r+args.days)).strftime("%Y%m%d")) for r in range(args.runs)]
+	cachedir = tempfile.mkdtemp()
+
+	try:
+		with FakeKNMI(latency=args.latency, perday=args.perday) as fake:
+			knmi2influxdb.KNMIURI = fake.uri
+			t0 = time.perf_counter()
+			uncached = [knmi2influxdb.get_knmi_data_historical(stations, r) for r in ranges]
+			t_uncached = time.perf_counter() - t0
+
+			t0 = time.perf_counter()
+			cached = [knmi2influxdb.get_knmi_data_historical_cached(stations, r, cachedir) for r in ranges]
+			t_cached = time.perf_counter() - t0
+			nrequests = fake.requests - len(ranges)
+
+		for u, c in zip(uncached, cached):
+			assert knmi2influxdb.convert_knmi(u, WRAPPERQUERY) == knmi2influxdb.convert_knmi(c, WRAPPERQUERY), "Cached data differs"
+		size = sum(os.path.getsize(os.path.join(d, f)) for d, _, fs in os.walk(cachedir) for f in fs)
+	finally:
+		shutil.rmtree(cachedir)
+
+	print("{} runs of {} days, {} stations".format(args.runs, args.days, args.stations))
+	print("uncached:           {:.2f}s ({} requests)".format(t_uncached, len(ranges)))
+	print("cached:             {:.2f}s ({} requests)".format(t_cached, nrequests))
+	print("speedup:            {:.1f}x".format(t_uncached/t_cached))
+	print("cache size:         {:.0f} kB".format(size/1024))
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+#
+# Benchmark scaling of sharded parallel conversion
+# iter_convert_knmi_parallel() with the number of processes, versus serial
+# convert_knmi() and convert_knmi_columnar().
+#
+# Usage: python3 benchmarks/bench_parallel_convert.py [--stations 4] [--days 3650] [--processes 1 2 4 8]
+
+import argparse
+import logging
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import knmi2influxdb
+from synthetic import knmi_hourly_lines, WRAPPERQUERY
+
+def timeit(func, *args, **kwargs):
+	t0 = time.perf_counter()
+	ret = func(*args, **kwargs)
+	return ret, time.perf_counter()-t0
+
+def main():
+	parser = argparse.ArgumentParser(description="Benchmark parallel KNMI conversion")
+	parser.add_argument("--stations", type=int, default=4, help="Number of synthetic stations")
+	parser.add_argument("--days", type=int, default=3650, help="Days of synthetic hourly data per station")
+	parser.add_argument("--processes", type=int, nargs="+", default=[1, 2, 4, 8], help="Numbers of processes to test")
+	parser.add_argument("--shardrows", type=int, default=knmi2influxdb.KNMISHARDROWS, help="Data rows per shard")
+	parser.add_argument("--query", default=WRAPPERQUERY, help="Query template to render")
+	args = parser.parse_args()
+
+	logging.raiseExceptions = False
+	lines = list(knmi_hourly_lines(stations=range(260, 260+args.stations), days=args.days))
+	nrows = args.stations*args.days*24
+	print("{} rows, {} CPUs".format(nrows, os.cpu_count()))
+
+	for parser in ('rows', 'columnar'):
+		serialfunc = knmi2influxdb.convert_knmi_columnar if parser == 'columnar' else knmi2influxdb.convert_knmi
+		ref, t_serial = timeit(serialfunc, lines, args.query)
+		print("{:8s} serial:        {:.3f}s ({:.0f} rows/s)".format(parser, t_serial, nrows/t_serial))
+		for processes in args.processes:
+			out, t = timeit(lambda: list(knmi2influxdb.iter_convert_knmi_parallel(lines, args.query, processes=processes, shardrows=args.shardrows, parser=parser)))
+			assert out == ref, "Parallel conversion output differs from serial conversion"
+			print("{:8s} {:2d} processes:  {:.3f}s ({:.0f} rows/s, {:.2f}x)".format(parser, processes, t, nrows/t, t_serial/t))
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+#
+# Benchmark row-wise knmi_records() versus columnar knmi_columns() parsing
+# of KNMI hourly CSV, and of the full conversion to line protocol.
+#
+# Usage: python3 benchmarks/bench_parse.py [--stations 2] [--days 3650]
+
+import argparse
+import gc
+import hashlib
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import knmi2influxdb
+from synthetic import knmi_hourly_lines, WRAPPERQUERY
+
+# Query using fields of all types
+TYPEQUERY = 'm,stn={STN:>5},day={YYYYMMDD:%Y-%m-%d},hh={HH:02d} dd={DD:d},t={T},td={TD} {DATETIME}{NEWLINE}q q={Q:d} {DATETIME}'
+
+def timeit(func, *args):
+	t0 = time.perf_counter()
+	ret = func(*args)
+	return ret, time.perf_counter()-t0
+
+def digest(influxdata):
+	return hashlib.sha256("\n".join(influxdata).encode()).hexdigest()
+
+def main():
+	parser = argparse.ArgumentParser(description="Benchmark KNMI CSV parsing")
+	parser.add_argument("--stations", type=int, default=2, help="Number of synthetic stations")
+	parser.add_argument("--days", type=int, default=3650, help="Days of synthetic hourly data per station")
+	parser.add_argument("--query", default=WRAPPERQUERY, help="Query template to render")
+	args = parser.parse_args()
+
+	lines = list(knmi_hourly_lines(stations=range(260, 260+args.stations), days=args.days))
+
+	# Keep only the length or a digest of each result, such that every step
+	# runs with the same amount of memory in use
+	nrecords, t_rows = timeit(lambda l: len(list(knmi2influxdb.knmi_records(l))), lines)
+	gc.collect()
+	_, t_cols = timeit(lambda l: len(knmi2influxdb.knmi_columns(l)), lines)
+	gc.collect()
+	ref, t_convrows = timeit(lambda l, q: digest(knmi2influxdb.convert_knmi(l, q)), lines, args.query)
+	gc.collect()
+	new, t_convcols = timeit(lambda l, q: digest(knmi2influxdb.convert_knmi_columnar(l, q)), lines, args.query)
+
+	assert ref == new, "Columnar conversion output differs from row-wise conversion"
+	# Fields that are not floats, e.g. STN as string and YYYYMMDD as datetime
+	sample = lines[:1000]
+	assert knmi2influxdb.convert_knmi(sample, TYPEQUERY) == knmi2influxdb.convert_knmi_columnar(sample, TYPEQUERY), "Columnar conversion output differs for {}".format(TYPEQUERY)
+	print("rows: {}".format(nrecords))
+	print("parse rows:       {:.3f}s ({:.0f} rows/s)".format(t_rows, nrecords/t_rows))
+	print("parse columnar:   {:.3f}s ({:.0f} rows/s)".format(t_cols, nrecords/t_cols))
+	print("convert rows:     {:.3f}s ({:.0f} rows/s)".format(t_convrows, nrecords/t_convrows))
+	print("convert columnar: {:.3f}s ({:.0f} rows/s)".format(t_convcols, nrecords/t_convcols))
+
+if __name__ == "__main__":
+	main()
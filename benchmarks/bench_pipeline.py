@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+#
+# Benchmark get_knmi_data_historical_pipeline(), which overlaps getting,
+# converting and writing windows of data, versus running these stages one
+# after another, against local fake KNMI and influxdb servers.
+#
+# Usage: python3 benchmarks/bench_pipeline.py [--histrange 20150101 20171231]
+
+import argparse
+import logging
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import knmi2influxdb
+from fakeknmi import FakeKNMI
+from fakeinflux import FakeInflux
+from synthetic import WRAPPERQUERY, knmi_hourly_csv
+
+def main():
+	parser = argparse.ArgumentParser(description="Benchmark pipelined historical backfill")
+	parser.add_argument("--histrange", nargs=2, default=['20150101', '20171231'], help="Time range as YYYYMMDD YYYYMMDD")
+	parser.add_argument("--window", type=int, default=31, help="Window size in days")
+	parser.add_argument("--workers", type=int, default=1, help="Number of concurrent requests")
+	parser.add_argument("--latency", type=float, default=0.05, help="Fixed latency per KNMI request (s)")
+	parser.add_argument("--perday", type=float, default=0.005, help="Additional latency per requested day (s)")
+	parser.add_argument("--influxlatency", type=float, default=0.05, help="Latency per influxdb write (s)")
+	parser.add_argument("--batchsize", type=int, default=5000, help="Entries per influxdb write")
+	args = parser.parse_args()
+
+	logging.raiseExceptions = False
+	knmi2influxdb.my_logger.setLevel(logging.WARNING)
+
+	# Serve the same window every time, such that generating data in the
+	# fake server does not compete with the conversion for the CPU
+	body = knmi_hourly_csv(stations=(260,), days=args.window).encode()
+	with FakeKNMI(latency=args.latency, perday=args.perday, body=body) as fake, FakeInflux(latency=args.influxlatency) as influx:
+		knmi2influxdb.KNMIURI = fake.uri
+		influx.keeplines = True
+
+		# Stages one after another, with the same windows
+		t0 = time.perf_counter()
+		knmidata = knmi2influxdb.get_knmi_data_historical_parallel(260, args.histrange, windowdays=args.window, workers=args.workers)
+		t_fetch = time.perf_counter() - t0
+		influxdata = knmi2influxdb.convert_knmi(knmidata, WRAPPERQUERY)
+		t_convert = time.perf_counter() - t0 - t_fetch
+		knmi2influxdb.influxdb_output(influx.uri, influxdata, chunksize=args.batchsize)
+		t_serial = time.perf_counter() - t0
+		t_write = t_serial - t_fetch - t_convert
+		serial, influx.lines = influx.lines, []
+
+		t0 = time.perf_counter()
+		influxdata = knmi2influxdb.get_knmi_data_historical_pipeline(260, args.histrange, WRAPPERQUERY, windowdays=args.window, workers=args.workers)
+		knmi2influxdb.influxdb_output(influx.uri, influxdata, chunksize=args.batchsize)
+		t_pipeline = time.perf_counter() - t0
+		pipeline = influx.lines
+
+	assert sorted(serial) == sorted(pipeline), "Pipeline writes different data"
+	print("fetch:              {:.2f}s".format(t_fetch))
+	print("convert:            {:.2f}s".format(t_convert))
+	print("write:              {:.2f}s".format(t_write))
+	print("stages in sequence: {:.2f}s".format(t_serial))
+	print("pipeline:           {:.2f}s ({:.1f}x, slowest stage {:.2f}s)".format(t_pipeline, t_serial/t_pipeline, max(t_fetch, t_convert, t_write)))
+
+if __name__ == "__main__":
+	main()
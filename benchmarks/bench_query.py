@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+#
+# Micro-benchmark of CompiledQuery.render() versus the previous approach of
+# formatting the full query with PartialFormatter and filtering out '~~'
+# fields afterwards.
+#
+# Usage: python3 benchmarks/bench_query.py [--days 365]
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import knmi2influxdb
+from synthetic import knmi_hourly_lines, WRAPPERQUERY
+
+# Queries with (possibly null) fields outside the field set
+TAGQUERIES = ('m,dd={DD:d} t={T:.1f} {DATETIME}', 'm,dd={DD} t={T} {DATETIME}', 'm t={T:.1f},q={Q:.0f} {DATETIME}{RH:.0f}')
+
+def render_partialformatter(query, fieldval, fmt=knmi2influxdb.PartialFormatter()):
+	# Rendering as done by convert_knmi() before the query was compiled
+	outline = fmt.format(query, NEWLINE="\n", **fieldval)
+	outline_fix = []
+	for l in outline.split('\n'):
+		outline_meas, outline_field, outline_time = l.split(' ')
+		outline_field = ','.join([w for w in outline_field.split(',') if not '~~' in w])
+		outline_fix.append(" ".join([outline_meas, outline_field, outline_time]))
+	return "\n".join(outline_fix)
+
+def main():
+	parser = argparse.ArgumentParser(description="Benchmark query rendering")
+	parser.add_argument("--days", type=int, default=365, help="Days of synthetic hourly data")
+	parser.add_argument("--nullfrac", type=float, default=0.01, help="Fraction of empty fields in synthetic data")
+	parser.add_argument("--query", default=WRAPPERQUERY, help="Query template to render")
+	args = parser.parse_args()
+
+	# Collect field values once, such that we only time rendering
+	fieldvals = list(knmi2influxdb.knmi_records(knmi_hourly_lines(days=args.days, nullfrac=args.nullfrac)))
+	compiled = knmi2influxdb.CompiledQuery(args.query)
+
+	t0 = time.perf_counter()
+	ref = [render_partialformatter(args.query, fv) for fv in fieldvals]
+	t1 = time.perf_counter()
+	new = [compiled.render(fv) for fv in fieldvals]
+	t2 = time.perf_counter()
+
+	assert ref == new, "CompiledQuery output differs from PartialFormatter"
+	# Null fields in tags or timestamp are rendered as '~~', with or
+	# without format spec
+	for query in TAGQUERIES:
+		tagcompiled = knmi2influxdb.CompiledQuery(query)
+		assert all(render_partialformatter(query, fv) == tagcompiled.render(fv) for fv in fieldvals), "CompiledQuery output differs from PartialFormatter for {}".format(query)
+	print("rows: {}".format(len(fieldvals)))
+	print("PartialFormatter: {:.3f}s ({:.0f} rows/s)".format(t1-t0, len(fieldvals)/(t1-t0)))
+	print("CompiledQuery:    {:.3f}s ({:.0f} rows/s)".format(t2-t1, len(fieldvals)/(t2-t1)))
+	print("speedup:          {:.1f}x".format((t1-t0)/(t2-t1)))
+
+if __name__ == "__main__":
+	main()
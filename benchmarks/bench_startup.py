@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+#
+# Benchmark startup cost of knmi2influxdb.py per mode using python's
+# -X importtime, running against local stand-ins for the KNMI servers.
+# Reports wall time per run, total import time and import time of the
+# heavy modules.
+#
+# Usage: python3 benchmarks/bench_startup.py [--repeat 3]
+
+import argparse
+import datetime
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from fakeknmi import FakeKNMI, FakeOpenData
+
+REPODIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+HEAVYMODULES = ('requests', 'numpy', 'netCDF4', 'yaml')
+
+def importtimes(stderr):
+	"""
+	Parse -X importtime output, return total import time and cumulative
+	time of each top-level import (both in us).
+	"""
+	total, modules = 0, {}
+	for l in stderr.splitlines():
+		if not l.startswith("import time:") or "imported package" in l:
+			continue
+		_, cumulative, package = l[len("import time:"):].split("|")
+		# Top-level imports are not indented
+		if not package[1:].startswith(" "):
+			total += int(cumulative)
+		modules.setdefault(package.strip(), int(cumulative))
+	return total, modules
+
+def main():
+	parser = argparse.ArgumentParser(description="Benchmark startup time per mode")
+	parser.add_argument("--repeat", type=int, default=3, help="Runs per mode, best is reported")
+	args = parser.parse_args()
+
+	now = datetime.datetime.now(datetime.timezone.utc).replace(second=0, microsecond=0)
+	now -= datetime.timedelta(minutes=now.minute % 10)
+	with FakeKNMI(latency=0) as knmi, FakeOpenData([now - datetime.timedelta(minutes=10*i) for i in range(3)]) as opendata, tempfile.TemporaryDirectory() as tmpdir:
+		outfile = os.path.join(tmpdir, 'out.txt')
+		modes = {
+			'import': [],
+			'help': ['--help'],
+			'historical': ['--time', 'historical', '--histrange', '2', '--outuri', outfile],
+			'actual': ['--time', 'actual', '--api_key', 'fake', '--outuri', outfile],
+		}
+		print("{:12s} {:>9s} {:>11s}  {}".format('mode', 'wall [ms]', 'import [ms]', '  '.join("{:>9s}".format(m) for m in HEAVYMODULES)))
+		for mode, argv in modes.items():
+			code = "import sys; sys.path.insert(0, {!r}); import knmi2influxdb as k; k.KNMIURI = {!r}; k.KNMIAPIURI = {!r}".format(REPODIR, knmi.uri, opendata.uri)
+			if mode != 'import':
+				code += "; k.main({!r})".format(argv)
+			best = None
+			for _ in range(args.repeat):
+				t0 = time.perf_counter()
+				proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], capture_output=True, text=True)
+				wall = time.perf_counter() - t0
+				if proc.returncode not in (0,) and mode != 'help':
+					print(proc.stderr[-2000:])
+					raise RuntimeError("Mode {} failed".format(mode))
+				total, modules = importtimes(proc.stderr)
+				if best is None or wall < best[0]:
+					best = (wall, total, modules)
+			wall, total, modules = best
+			heavy = "  ".join("{:>9s}".format("{:.1f}".format(modules[m]/1000) if m in modules else '-') for m in HEAVYMODULES)
+			print("{:12s} {:9.1f} {:11.1f}  {}".format(mode, wall*1000, total/1000, heavy))
+
+if __name__ == "__main__":
+	main()
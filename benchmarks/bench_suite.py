@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+#
+# End-to-end benchmark of knmi2influxdb.py against synthetic KNMI data
+# served from local stand-ins for the KNMI endpoints and influxdb. Times
+# each stage separately and reports rows/s, points/s and peak memory
+# allocated per stage. Results are written as JSON, such that versions can
+# be compared with --compare.
+#
+# Usage:
+#   python3 benchmarks/bench_suite.py --stations 2 --years 2 --output new.json
+#   python3 benchmarks/bench_suite.py --output new.json --compare old.json
+
+import argparse
+import contextlib
+import datetime
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import knmi2influxdb
+from fakeinflux import FakeInflux
+from fakeknmi import FakeKNMI, FakeOpenData
+from synthetic import knmi_hourly_csv, WRAPPERQUERY
+
+def npoints(influxdata):
+	return sum(entry.count("\n")+1 for entry in influxdata)
+
+class Stage:
+	"""
+	Time one stage, record rows, points and bytes processed. If tracemalloc
+	is tracing, record the peak memory allocated during this stage instead
+	(on top of what was allocated before), such that earlier stages do not
+	count.
+	"""
+	def __init__(self, results, name):
+		self.results, self.name = results, name
+		self.rows = self.points = self.bytes = 0
+
+	def __enter__(self):
+		if tracemalloc.is_tracing():
+			tracemalloc.reset_peak()
+			self.mem0 = tracemalloc.get_traced_memory()[0]
+		self.t0 = time.perf_counter()
+		return self
+
+	def __exit__(self, *args):
+		dt = time.perf_counter() - self.t0
+		if tracemalloc.is_tracing():
+			self.results[self.name] = {'peak_alloc_kb': (tracemalloc.get_traced_memory()[1] - self.mem0) // 1024}
+			return
+		self.results[self.name] = {
+			'seconds': dt,
+			'rows': self.rows, 'rows_per_s': self.rows/dt,
+			'points': self.points, 'points_per_s': self.points/dt,
+			'bytes': self.bytes,
+		}
+
+def version():
+	try:
+		return subprocess.run(['git', 'describe', '--always', '--dirty'], capture_output=True, text=True,
+			cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or 'unknown'
+	except OSError:
+		return 'unknown'
+
+def run(args):
+	stages = {}
+	stations = list(knmi2influxdb.KNMISTATIONS[:args.stations])
+	start = datetime.date(2000, 1, 1)
+	days = int(args.years*365)
+	histrange = (start.strftime("%Y%m%d"), (start + datetime.timedelta(days=days-1)).strftime("%Y%m%d"))
+	body = knmi_hourly_csv(stations=stations, start=start, days=days).encode()
+
+	with FakeKNMI(latency=0, body=body) as fake:
+		knmi2influxdb.KNMIURI = fake.uri
+		with Stage(stages, 'get_knmi_data_historical') as st:
+			knmidata = knmi2influxdb.get_knmi_data_historical(stations, histrange)
+			st.rows, st.bytes = len(knmidata), len(body)
+
+	with Stage(stages, 'convert_knmi') as st:
+		influxdata = knmi2influxdb.convert_knmi(knmidata, args.query)
+		st.rows, st.points = len(influxdata), npoints(influxdata)
+
+	if hasattr(knmi2influxdb, 'convert_knmi_columnar'):
+		with Stage(stages, 'convert_knmi_columnar') as st:
+			influxdata = knmi2influxdb.convert_knmi_columnar(knmidata, args.query)
+			st.rows, st.points = len(influxdata), npoints(influxdata)
+
+	with FakeInflux() as fake:
+		with Stage(stages, 'influxdb_output') as st:
+			knmi2influxdb.influxdb_output(fake.uri, influxdata)
+			st.rows, st.points, st.bytes = len(influxdata), fake.points, fake.bytes
+
+	# Files for the last two hours, such that the newest is picked up
+	now = datetime.datetime.now(datetime.timezone.utc).replace(second=0, microsecond=0)
+	now -= datetime.timedelta(minutes=now.minute % 10)
+	obstimes = [now - datetime.timedelta(minutes=10*i) for i in range(12)]
+	with FakeOpenData(obstimes) as fake:
+		knmi2influxdb.KNMIAPIURI = fake.uri
+		fake.nc(sorted(fake.files)[-1])
+		with Stage(stages, 'get_knmi_data_actual') as st, contextlib.redirect_stdout(open(os.devnull, 'w')):
+			for _ in range(args.actualruns):
+				influxdata = knmi2influxdb.get_knmi_data_actual('fakekey', 'all', args.query)
+				st.rows += len(influxdata)
+				st.points += npoints(influxdata)
+
+	return stages
+
+def compare(results, baseline):
+	print("\nComparison with {} (ratio new/old, >1 is faster for rates):".format(baseline['version']))
+	for name, new in results['stages'].items():
+		old = baseline['stages'].get(name)
+		if not old:
+			continue
+		rate = 'points_per_s' if new['points'] else 'rows_per_s'
+		mem = new['peak_alloc_kb']/old['peak_alloc_kb'] if new.get('peak_alloc_kb') and old.get('peak_alloc_kb') else float('nan')
+		print("  {:28s} {:6.2f}x {:12s} {:6.2f}x time {:6.2f}x memory".format(name, new[rate]/old[rate] if old[rate] else float('nan'), rate, new['seconds']/old['seconds'], mem))
+
+def main():
+	parser = argparse.ArgumentParser(description="Benchmark all stages of knmi2influxdb.py")
+	parser.add_argument("--stations", type=int, default=2, help="Number of stations for historical data")
+	parser.add_argument("--years", type=float, default=2, help="Years of historical data per station")
+	parser.add_argument("--actualruns", type=int, default=10, help="Number of actual data runs (all stations)")
+	parser.add_argument("--query", default=WRAPPERQUERY, help="Query template")
+	parser.add_argument("--nomemory", action='store_true', help="Do not measure peak memory per stage, which runs all stages a second time")
+	parser.add_argument("--output", help="Write results as JSON to this file")
+	parser.add_argument("--compare", help="Compare with results JSON from an earlier run")
+	args = parser.parse_args()
+
+	logging.raiseExceptions = False
+	results = {
+		'version': version(),
+		'date': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+		'python': platform.python_version(),
+		'platform': platform.platform(),
+		'params': {'stations': args.stations, 'years': args.years, 'actualruns': args.actualruns, 'query': args.query},
+		'stages': run(args),
+	}
+	if not args.nomemory:
+		# Measure memory in a second run, tracemalloc slows down allocations
+		# and would distort the timings
+		tracemalloc.start()
+		for name, st in run(args).items():
+			results['stages'][name].update(st)
+		tracemalloc.stop()
+
+	print("{:28s} {:>8s} {:>10s} {:>12s} {:>10s} {:>12s} {:>12s}".format('stage', 'seconds', 'rows', 'rows/s', 'points', 'points/s', 'peak alloc kB'))
+	for name, st in results['stages'].items():
+		print("{:28s} {:8.3f} {:10d} {:12.0f} {:10d} {:12.0f} {:>12}".format(name, st['seconds'], st['rows'], st['rows_per_s'], st['points'], st['points_per_s'], st.get('peak_alloc_kb', '-')))
+
+	if args.output:
+		with open(args.output, 'w') as fd:
+			json.dump(results, fd, indent=1)
+	if args.compare:
+		with open(args.compare) as fd:
+			compare(results, json.load(fd))
+
+if __name__ == "__main__":
+	main()
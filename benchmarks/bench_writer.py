@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+#
+# Benchmark InfluxWriter against a local fake influxdb endpoint with latency
+# and injected failures, including spilling to and replaying from the
+# journal directory.
+#
+# Usage: python3 benchmarks/bench_writer.py [--days 365]
+
+import argparse
+import logging
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import knmi2influxdb
+from fakeinflux import FakeInflux
+from synthetic import knmi_hourly_lines, WRAPPERQUERY
+
+def run(influxdata, npoints, label, fake, **kwargs):
+	writer = knmi2influxdb.InfluxWriter(fake.uri, **kwargs)
+	t0 = time.perf_counter()
+	ok = writer.write(influxdata)
+	dt = time.perf_counter() - t0
+	print("{:28s} {:6.2f}s {:9.0f} points/s, {:4d} requests, {:3d} failed, {:3d} spilled, {:8.1f} kB sent, ok={}".format(
+		label, dt, writer.points/dt, fake.requests, fake.failures, writer.spilled, fake.bytes/1024, ok))
+	return writer
+
+def main():
+	parser = argparse.ArgumentParser(description="Benchmark influxdb writer")
+	parser.add_argument("--days", type=int, default=365, help="Days of synthetic hourly data")
+	parser.add_argument("--batchsize", type=int, default=200, help="Entries per request")
+	parser.add_argument("--latency", type=float, default=0.02, help="Latency per request (s)")
+	parser.add_argument("--failrate", type=float, default=0.2, help="Fraction of failing requests")
+	args = parser.parse_args()
+
+	logging.raiseExceptions = False
+	knmi2influxdb.RETRYBACKOFF = 0.01
+
+	influxdata = knmi2influxdb.convert_knmi(knmi_hourly_lines(days=args.days), WRAPPERQUERY)
+	npoints = sum(entry.count("\n")+1 for entry in influxdata)
+	print("entries: {}, points: {}".format(len(influxdata), npoints))
+
+	for compress in (False, True):
+		with FakeInflux(latency=args.latency) as fake:
+			run(influxdata, npoints, "healthy, gzip={}".format(compress), fake, batchsize=args.batchsize, compress=compress)
+
+	with FakeInflux(latency=args.latency, failrate=args.failrate) as fake:
+		writer = run(influxdata, npoints, "failrate={}".format(args.failrate), fake, batchsize=args.batchsize)
+		assert fake.points == npoints, "Points lost despite retries"
+
+	with tempfile.TemporaryDirectory() as journaldir:
+		with FakeInflux(latency=args.latency, down=True) as fake:
+			run(influxdata, npoints, "down, spill to journal", fake, batchsize=args.batchsize, retries=1, journaldir=journaldir)
+		with FakeInflux(latency=args.latency) as fake:
+			writer = knmi2influxdb.InfluxWriter(fake.uri, batchsize=args.batchsize, journaldir=journaldir)
+			t0 = time.perf_counter()
+			ok = writer.replay()
+			dt = time.perf_counter() - t0
+			print("{:28s} {:6.2f}s {:9.0f} points/s, {:4d} requests, ok={}".format("replay journal", dt, writer.points/dt, fake.requests, ok))
+			assert fake.points == npoints and not os.listdir(journaldir), "Journal replay incomplete"
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+#
+# Local stand-in for the influxdb /write endpoint, with configurable latency
+# and injected failures.
+
+import gzip
+import http.server
+import random
+import threading
+import time
+
+class FakeInflux:
+	"""
+	Accept influxdb line protocol writes on a local port and count the
+	received points. Each request takes `latency` seconds, a fraction
+	`failrate` of requests fails with HTTP 503. If `down` is set, all
+	requests fail.
+	"""
+	def __init__(self, latency=0.0, failrate=0.0, down=False, seed=0):
+		self.latency, self.failrate, self.down = latency, failrate, down
+		self.rnd = random.Random(seed)
+		self.points, self.requests, self.failures, self.bytes = 0, 0, 0, 0
+		self.lines = []
+		self.keeplines = False
+		self.lock = threading.Lock()
+		fake = self
+
+		class Handler(http.server.BaseHTTPRequestHandler):
+			def do_POST(self):
+				body = self.rfile.read(int(self.headers['Content-Length']))
+				time.sleep(fake.latency)
+				with fake.lock:
+					fake.requests += 1
+					fake.bytes += len(body)
+					fail = fake.down or fake.rnd.random() < fake.failrate
+					if fail:
+						fake.failures += 1
+				if fail:
+					self.send_response(503)
+					self.end_headers()
+					return
+				if self.headers.get('Content-Encoding') == 'gzip':
+					body = gzip.decompress(body)
+				lines = body.decode().split("\n")
+				with fake.lock:
+					fake.points += len(lines)
+					if fake.keeplines:
+						fake.lines.extend(lines)
+				self.send_response(204)
+				self.end_headers()
+
+			def log_message(self, *args):
+				pass
+
+		self.server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+		self.uri = "http://127.0.0.1:{}/write?db=test&precision=s".format(self.server.server_port)
+
+	def __enter__(self):
+		threading.Thread(target=self.server.serve_forever, daemon=True).start()
+		return self
+
+	def __exit__(self, *args):
+		self.server.shutdown()
+		self.server.server_close()
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+#
+# Local stand-in for the KNMI hourly data endpoint, serving synthetic data
+# with configurable latency and failures.
+
+import datetime
+import http.server
+import json
+import threading
+import time
+import urllib.parse
+
+from synthetic import knmi_hourly_csv, knmi_actual_filename, knmi_actual_nc
+
+class FakeKNMI:
+	"""
+	Serve synthetic KNMI hourly data on a local port. Each request takes
+	`latency` + `perday` * days seconds. The first `failures` requests fail
+	with HTTP 503.
+	"""
+	def __init__(self, latency=0.1, perday=0.0, failures=0, body=None):
+		self.latency, self.perday, self.failures = latency, perday, failures
+		# Serve fixed response instead of generating one per request
+		self.body = body
+		self.requests = 0
+		self.lock = threading.Lock()
+		fake = self
+
+		class Handler(http.server.BaseHTTPRequestHandler):
+			def do_POST(self):
+				query = urllib.parse.parse_qs(self.rfile.read(int(self.headers['Content-Length'])).decode())
+				with fake.lock:
+					fake.requests += 1
+					fail = fake.requests <= fake.failures
+				if fail:
+					self.send_response(503)
+					self.end_headers()
+					return
+				start = datetime.datetime.strptime(query['start'][0][:8], "%Y%m%d").date()
+				end = datetime.datetime.strptime(query['end'][0][:8], "%Y%m%d").date()
+				stations = [int(s) for s in query['stns'][0].split(':')]
+				days = (end - start).days + 1
+				time.sleep(fake.latency + fake.perday*days)
+				body = fake.body or knmi_hourly_csv(stations=stations, start=start, days=days).encode()
+				self.send_response(200)
+				self.send_header('Content-Type', 'text/plain')
+				self.send_header('Content-Length', str(len(body)))
+				self.end_headers()
+				self.wfile.write(body)
+
+			def log_message(self, *args):
+				pass
+
+		self.server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+		self.uri = "http://127.0.0.1:{}/".format(self.server.server_port)
+
+	def __enter__(self):
+		threading.Thread(target=self.server.serve_forever, daemon=True).start()
+		return self
+
+	def __exit__(self, *args):
+		self.server.shutdown()
+		self.server.server_close()
+
+class FakeOpenData:
+	"""
+	Serve the KNMI Open Data API for the 10-minute dataset on a local port:
+	file listing (paginated), temporary download URLs and the synthetic
+	netCDF files themselves for observation times `obstimes`. Each request
+	takes `latency` seconds.
+	"""
+	def __init__(self, obstimes, latency=0.0, stations=None):
+		self.latency = latency
+		self.files = {knmi_actual_filename(t): t for t in sorted(obstimes)}
+		self.stations = stations
+		self.cache = {}
+		self.requests, self.downloads = 0, 0
+		self.lock = threading.Lock()
+		fake = self
+
+		class Handler(http.server.BaseHTTPRequestHandler):
+			def do_GET(self):
+				url = urllib.parse.urlparse(self.path)
+				query = {k: v[0] for k, v in urllib.parse.parse_qs(url.query).items()}
+				path = url.path.split('/')
+				time.sleep(fake.latency)
+				with fake.lock:
+					fake.requests += 1
+				if path[1] == 'download' and path[2] in fake.files:
+					self.reply(fake.nc(path[2]), 'application/x-netcdf')
+					with fake.lock:
+						fake.downloads += 1
+				elif path[-1] == 'files':
+					self.reply(json.dumps(fake.listing(query)).encode(), 'application/json')
+				elif path[-1] == 'url' and path[-2] in fake.files:
+					body = {"temporaryDownloadUrl": "http://127.0.0.1:{}/download/{}".format(fake.server.server_port, path[-2])}
+					self.reply(json.dumps(body).encode(), 'application/json')
+				else:
+					self.send_response(404)
+					self.end_headers()
+
+			def reply(self, body, ctype):
+				self.send_response(200)
+				self.send_header('Content-Type', ctype)
+				self.send_header('Content-Length', str(len(body)))
+				self.end_headers()
+				self.wfile.write(body)
+
+			def log_message(self, *args):
+				pass
+
+		self.server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+		self.uri = "http://127.0.0.1:{}/open-data".format(self.server.server_port)
+
+	def nc(self, filename):
+		with self.lock:
+			if filename not in self.cache:
+				kwargs = {'stations': self.stations} if self.stations else {}
+				self.cache[filename] = knmi_actual_nc(self.files[filename], **kwargs)
+			return self.cache[filename]
+
+	def listing(self, query):
+		# Filenames sort by time, like the real API. nextPageToken is simply
+		# the last filename of the current page here.
+		maxkeys = int(query.get('maxKeys', 10))
+		after = query.get('nextPageToken', query.get('startAfterFilename', ''))
+		names = [f for f in self.files if f > after]
+		page = names[:maxkeys]
+		listing = {"isTruncated": len(names) > maxkeys, "resultCount": len(page), "maxResults": maxkeys,
+			"files": [{"filename": f, "size": 0, "lastModified": self.files[f].isoformat()} for f in page]}
+		if listing["isTruncated"]:
+			listing["nextPageToken"] = page[-1]
+		return listing
+
+	def __enter__(self):
+		threading.Thread(target=self.server.serve_forever, daemon=True).start()
+		return self
+
+	def __exit__(self, *args):
+		self.server.shutdown()
+		self.server.server_close()
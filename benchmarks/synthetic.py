@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+#
+# Synthetic KNMI data for benchmarking knmi2influxdb.py without hitting the
+# KNMI servers.
+
+import datetime
+import random
+
+# Column header as returned by the KNMI hourly data script interface
+KNMIHEADER = "# STN,YYYYMMDD,   HH,   DD,   FH,   FF,   FX,    T,  T10,   TD,   SQ,    Q,   DR,   RH,    P,   VV,    N,    U,   WW,   IX,    M,    R,    S,    O,    Y"
+
+# Historical query as used in knmi2influxdb-wrapper_historical.sh
+WRAPPERQUERY = 'temperaturev3,quantity=actual,source=knmi{STN},location=outside value={T:.2f} {DATETIME}{NEWLINE}weatherv3,quantity=rain,type=duration,source=knmi{STN} value={DR:.2f} {DATETIME}{NEWLINE}weatherv3,quantity=rain,type=quantity,source=knmi{STN} value={RH:.2f} {DATETIME}{NEWLINE}weatherv3,quantity=wind,type=speed,source=knmi{STN} value={FF:.2f} {DATETIME}{NEWLINE}weatherv3,quantity=wind,type=gust,source=knmi{STN} value={FX:.2f} {DATETIME}{NEWLINE}weatherv3,quantity=wind,type=direction,source=knmi{STN} value={DD} {DATETIME}{NEWLINE}energyv3,quantity=irradiance,type=production,source=knmi{STN} value={Q:.0f} {DATETIME}'
+
+def knmi_hourly_lines(stations=(260,), start=datetime.date(2010, 1, 1), days=365, nullfrac=0.01, seed=0):
+	"""
+	Generate KNMI hourly CSV lines for `stations` for `days` days since
+	`start`, including comment header. A fraction `nullfrac` of the fields
+	is left empty, like KNMI does for missing observations. Values only
+	depend on `seed`, station and date, such that queries for a sub range
+	give the same rows.
+	"""
+	yield "# BRON: KONINKLIJK NEDERLANDS METEOROLOGISCH INSTITUUT (KNMI)"
+	yield "# Opmerking: door invoering van de nieuwe luchtdrukmeter ..."
+	yield "# "
+	yield "# STN      LON(east)   LAT(north)     ALT(m)  NAME"
+	for stn in stations:
+		yield "# {:3d}:         5.180       52.100       1.90  Station {}".format(stn, stn)
+	yield "# "
+	yield KNMIHEADER
+	yield "# "
+	def val(v):
+		return "" if rnd.random() < nullfrac else str(v)
+	for stn in stations:
+		for d in range(days):
+			yyyymmdd = (start + datetime.timedelta(days=d)).strftime("%Y%m%d")
+			rnd = random.Random("{}-{}-{}".format(seed, stn, yyyymmdd))
+			for hh in range(1, 25):
+				row = [str(stn), yyyymmdd, str(hh),
+					val(rnd.randrange(0, 361, 10)), val(rnd.randrange(0, 150)), val(rnd.randrange(0, 150)),
+					val(rnd.randrange(0, 250)), val(rnd.randrange(-100, 300)), "", val(rnd.randrange(-100, 200)),
+					val(rnd.randrange(0, 11)), val(rnd.randrange(0, 300)), val(rnd.randrange(0, 11)),
+					val(rnd.randrange(-1, 30)), val(rnd.randrange(9800, 10400)), val(rnd.randrange(0, 90)),
+					val(rnd.randrange(0, 9)), val(rnd.randrange(40, 100)), "", "5", "0", "0", "0", "0", "0"]
+				yield ",".join("{:>5}".format(c) for c in row)
+
+def knmi_hourly_csv(*args, **kwargs):
+	"""
+	Like knmi_hourly_lines(), but return CSV as one string.
+	"""
+	return "\n".join(knmi_hourly_lines(*args, **kwargs)) + "\n"
+
+# Observation variables in the KNMI 10-minute netCDF files, with units and
+# (min, max) of synthetic values
+KNMIACTUALVARS = {
+	'dd': ('degree', 0, 360), 'ff': ('m s-1', 0, 20), 'gff': ('m s-1', 0, 30),
+	'ta': ('degrees Celsius', -10, 30), 'rh': ('%', 30, 100), 'pp': ('hPa', 980, 1040),
+	'zm': ('m', 100, 50000), 'D1H': ('min', 0, 60), 'dr': ('sec', 0, 600),
+	'hc': ('ft', 0, 10000), 'hc1': ('ft', 0, 10000), 'hc2': ('ft', 0, 10000), 'hc3': ('ft', 0, 10000),
+	'nc': ('octa', 0, 8), 'nc1': ('octa', 0, 8), 'nc2': ('octa', 0, 8), 'nc3': ('octa', 0, 8),
+	'pg': ('mm/h', 0, 10), 'pr': ('sec', 0, 600), 'qg': ('W m-2', 0, 900),
+	'R12H': ('mm', 0, 30), 'R1H': ('mm', 0, 10), 'R24H': ('mm', 0, 50), 'R6H': ('mm', 0, 20),
+	'rg': ('mm/h', 0, 10), 'ss': ('min', 0, 10), 'td': ('degrees Celsius', -15, 20),
+	'tgn': ('degrees Celsius', -15, 30), 'Tgn12': ('degrees Celsius', -15, 30), 'Tgn14': ('degrees Celsius', -15, 30), 'Tgn6': ('degrees Celsius', -15, 30),
+	'tn': ('degrees Celsius', -10, 30), 'Tn12': ('degrees Celsius', -10, 30), 'Tn14': ('degrees Celsius', -10, 30), 'Tn6': ('degrees Celsius', -10, 30),
+	'tx': ('degrees Celsius', -10, 30), 'Tx12': ('degrees Celsius', -10, 30), 'Tx24': ('degrees Celsius', -10, 30), 'Tx6': ('degrees Celsius', -10, 30),
+	'ww': ('code', 0, 99), 'pwc': ('code', 0, 99), 'ww-10': ('code', 0, 99),
+	'ts1': ('Number', 0, 10), 'ts2': ('Number', 0, 10),
+}
+
+def knmi_actual_filename(obstime):
+	"""
+	KNMI Open Data filename of 10-minute file for `obstime` (datetime).
+	"""
+	return "KMDS__OPER_P___10M_OBS_L2_{}.nc".format(obstime.strftime('%Y%m%d%H%M'))
+
+def knmi_actual_nc(obstime, stations=(210, 215, 225, 235, 240, 242, 249, 251, 257, 258, 260, 265, 267, 269, 270, 273, 275, 277, 278, 279, 280, 283, 286, 290, 310, 319, 323, 330, 340, 344, 348, 350, 356, 370, 375, 377, 380, 391), maskfrac=0.1, seed=0):
+	"""
+	Generate KNMI 10-minute netCDF file for `obstime` (datetime, UTC) and
+	`stations`, return as bytes. A fraction `maskfrac` of the values is
+	masked, like for stations that do not measure all variables.
+	"""
+	import netCDF4
+	import numpy as np
+
+	rng = np.random.default_rng([seed, int(obstime.timestamp())])
+	rootgrp = netCDF4.Dataset("synthetic.nc", "w", format="NETCDF4", memory=1024)
+	rootgrp.createDimension('station', len(stations))
+	rootgrp.createDimension('time', 1)
+
+	var = rootgrp.createVariable('station', str, ('station',))
+	var[:] = np.array(["06{}".format(stn) for stn in stations], dtype=object)
+	var = rootgrp.createVariable('stationname', str, ('station',))
+	var[:] = np.array(["STATION {}".format(stn) for stn in stations], dtype=object)
+	var = rootgrp.createVariable('time', 'f8', ('time',))
+	var.units, var.long_name = 'seconds since 1950-01-01 00:00:00', 'time of measurement'
+	epoch1950 = datetime.datetime(1950, 1, 1, tzinfo=datetime.timezone.utc)
+	var[:] = [(obstime - epoch1950).total_seconds()]
+	for name, units in (('lat', 'degrees_north'), ('lon', 'degrees_east'), ('height', 'm')):
+		var = rootgrp.createVariable(name, 'f8', ('station',))
+		var.units = units
+		var[:] = rng.uniform(0, 60, len(stations))
+
+	for name, (units, vmin, vmax) in KNMIACTUALVARS.items():
+		var = rootgrp.createVariable(name, 'f8', ('station', 'time'), fill_value=-9999.)
+		var.units, var.long_name = units, name
+		values = np.ma.masked_array(np.round(rng.uniform(vmin, vmax, (len(stations), 1)), 2))
+		values[rng.random((len(stations), 1)) < maskfrac] = np.ma.masked
+		var[:] = values
+
+	return bytes(rootgrp.close())
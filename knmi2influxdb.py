@@ -10,6 +10,16 @@
 # # Quick start
 #
 # /usr/bin/python3 knmi2influxdb.py --time actual --station 260
+#
+# # Library use
+#
+# import knmi2influxdb
+# knmidata = knmi2influxdb.get_knmi_data_historical(260, ('20200101', '20200131'))
+# influxdata = knmi2influxdb.convert_knmi(knmidata, knmi2influxdb.DEFAULTQUERY)
+# knmi2influxdb.influxdb_output('knmidata.txt', influxdata)
+#
+# or get_knmi_data_actual(api_key, 260) for actual data. main(argv) runs the
+# command line interface.
 # 
 # # References
 #
@@ -59,23 +69,52 @@
 # 380      Maastricht
 # 391      Arcen 
 
-import urllib.request
 import requests
-import csv
 import argparse
 import datetime
-import netCDF4
+import io
 import logging
 import logging.handlers
 import time
-import yaml
+import re
+import itertools
+import gzip
+import json
+import os
+import collections
+import contextlib
+import functools
+import threading
+import concurrent.futures
+import queue
+import multiprocessing
+# N.B. netCDF4, numpy and yaml are imported where needed, such that e.g.
+# historical runs do not pay for importing netCDF4
 
 
 #DEFAULTQUERY='test,src=outside_knmi{STN} wind={DD},windspeed={FF:.1f},temp={T:.1f},irrad={Q:.2f},rain={RH:.1f} {DATETIME}'
 #DEFAULTQUERY='temperaturev2 outside_knmi{STN}={T:.1f} {DATETIME}{NEWLINE}weatherv2 rain_duration_knmi{STN}={DR:.1f},rain_qty_knmi{STN}={RH:.1f},wind_speed_knmi{STN}={FF:.1f},wind_gust_knmi{STN}={FX:.1f},wind_dir_knmi{STN}={DD} {DATETIME}{NEWLINE}energyv2 irradiance_knmi{STN}={Q:.0f} {DATETIME}'
 DEFAULTQUERY='temperaturev2 outside_knmi{STN}={T:.1f} {DATETIME}'
 KNMISTATION=260 # KNMI station for getting live data. See http://projects.knmi.nl/klimatologie/uurgegevens/
+KNMISTATIONS = (210, 215, 225, 235, 240, 242, 249, 251, 257, 258, 260, 265, 267, 269, 270, 273, 275, 277, 278, 279, 280, 283, 286, 290, 310, 319, 323, 330, 340, 344, 348, 350, 356, 370, 375, 377, 380, 391)
 KNMIURI = 'https://www.daggegevens.knmi.nl/klimatologie/uurgegevens'
+KNMIAPIURI = 'https://api.dataplatform.knmi.nl/open-data'
+KNMIDATASET = 'Actuele10mindataKNMIstations' # Open Data dataset of 10-minute actual data
+KNMIDATASETVERSION = '2'
+STREAMCHUNKBYTES = 64*1024 # Read size for streaming KNMI responses
+RETRYBACKOFF = 1 # Initial delay in seconds between retries of failed requests, doubled every attempt
+ACTUALRETRY = 30 # Seconds between polls for a new actual data file in daemon mode
+INFLUXBATCHSIZE = 5000 # Number of line protocol entries per influxdb write request
+KNMISHARDROWS = 50000 # Number of KNMI data rows per shard for parallel conversion
+PIPELINEQUEUE = 2 # Number of items waiting between stages of iter_pipeline()
+HISTCACHEFINAL = 2 # Days after which cached historical data is final, before that KNMI may still add or correct data
+HISTCACHEMAXAGE = 3600 # Seconds after which cached historical days that are not final yet are fetched again
+ACTUALCACHEMAXAGE = 7*86400 # Seconds after which cached actual data files that were not used are removed
+
+# Thread-local storage for http_session()
+_threadlocal = threading.local()
+# InfluxWriters for influxdb_output(), by settings
+_influxwriters = {}
 
 # Required for graceful None formatting, sometimes KNMI data has null entries, 
 # but influxdb does not recognize this. We solve this by rendering None and 
@@ -106,8 +145,192 @@ class PartialFormatter(string.Formatter):
 				my_logger.exception("Exception occurred in format_field()")
 				raise
 
-def get_knmi_data_historical(knmistation=KNMISTATION, histrange=(21,)):
-	my_logger.debug("get_knmi_data_historical(knmistation={}, histrange={})".format(knmistation, histrange))
+# Compiled version of the --query template. Formatting the full query for
+# every row and then splitting the result on newlines, spaces and commas to
+# filter out PartialFormatter's '~~' placeholders is slow for large
+# historical datasets. Instead, we parse the template once into lines of
+# (measurement, fields, time) segments, and know for each segment which
+# fields it uses, such that null fields can be dropped directly.
+class QueryLine:
+	__slots__ = ('fmt', 'fields', 'measurement', 'fieldset', 'timestamp')
+
+	def __init__(self, fmt, fields, measurement=None, fieldset=None, timestamp=None):
+		# Full line as format string and the fields it uses, for the fast path
+		self.fmt, self.fields = fmt, fields
+		# Segments as (format string, fields) tuples, fieldset is a list of
+		# those. If None, the line could not be split in three parts and is
+		# rendered as-is.
+		self.measurement, self.fieldset, self.timestamp = measurement, fieldset, timestamp
+
+class CompiledQuery:
+	"""
+	Render `query` to influxdb line protocol, dropping fields that are None
+	or missing. Output is identical to formatting the query with
+	PartialFormatter and removing fields containing '~~' afterwards.
+	"""
+	def __init__(self, query):
+		self.query = query
+		self.fmt = PartialFormatter()
+		self.lines = []
+		for tokens in self._split_tokens(self._tokenize(query), '\n'):
+			self.lines.append(self._compile_line(tokens))
+		self.fields = frozenset().union(*(l.fields for l in self.lines))
+		# Full query as one format string, for rows without null fields
+		self.allfields = tuple(self.fields)
+		self.allfmt = "\n".join(l.fmt for l in self.lines)
+
+	@staticmethod
+	def _tokenize(query):
+		# Tokenize as literal strings and (fieldname, format string) tuples.
+		# {NEWLINE} is always a newline, so make it a literal here already.
+		tokens = []
+		for literal, fname, spec, conv in string.Formatter().parse(query):
+			if literal:
+				tokens.append(literal)
+			if fname is None:
+				continue
+			if fname == 'NEWLINE':
+				tokens.append('\n')
+				continue
+			fieldfmt = '{' + fname + ('!' + conv if conv else '') + (':' + spec if spec else '') + '}'
+			# Use root field name, e.g. 'T' for {T.real} or {T[0]}
+			tokens.append((re.match(r'[^.\[]*', fname).group(0), fieldfmt))
+		return tokens
+
+	@staticmethod
+	def _split_tokens(tokens, sep):
+		# Split token list on separator in literals only
+		parts = [[]]
+		for tok in tokens:
+			if isinstance(tok, tuple):
+				parts[-1].append(tok)
+				continue
+			for i, lit in enumerate(tok.split(sep)):
+				if i > 0:
+					parts.append([])
+				if lit:
+					parts[-1].append(lit)
+		return parts
+
+	@staticmethod
+	def _segment(tokens):
+		# Convert token list back to (format string, fields) tuple
+		fmt = ''.join(tok[1] if isinstance(tok, tuple) else tok.replace('{', '{{').replace('}', '}}') for tok in tokens)
+		return fmt, frozenset(tok[0] for tok in tokens if isinstance(tok, tuple))
+
+	def _compile_line(self, tokens):
+		fmt, fields = self._segment(tokens)
+		# Get field sets by splitting by space into three parts (https://docs.influxdata.com/influxdb/v1.7/write_protocols/line_protocol_tutorial/)
+		sections = self._split_tokens(tokens, ' ')
+		if len(sections) != 3:
+			my_logger.warning("Could not split query line in measurement, fields and time: {}".format(fmt))
+			return QueryLine(fmt, fields)
+		fieldset = [self._segment(f) for f in self._split_tokens(sections[1], ',')]
+		return QueryLine(fmt, fields, self._segment(sections[0]), fieldset, self._segment(sections[2]))
+
+	def _format(self, segment, fieldval, nulls=()):
+		fmt, fields = segment
+		if not fields.isdisjoint(nulls):
+			# Null fields outside the field set are rendered as '~~', like
+			# PartialFormatter does
+			return self.fmt.vformat(fmt, (), fieldval)
+		try:
+			return fmt.format_map(fieldval)
+		except (KeyError, ValueError, TypeError, IndexError, AttributeError):
+			# Fall back to PartialFormatter for missing fields or bad format
+			return self.fmt.vformat(fmt, (), fieldval)
+
+	def _render_line(self, l, fieldval, nulls):
+		# Render QueryLine `l` with null fields `nulls`
+		if l.fields.isdisjoint(nulls):
+			return self._format((l.fmt, l.fields), fieldval)
+		if l.fieldset is None:
+			return self.fmt.vformat(l.fmt, (), fieldval)
+		# Influxdb does not recognize None or null as values, so drop
+		# fields that use any of those.
+		outfields = ','.join(self._format(f, fieldval) for f in l.fieldset if f[1].isdisjoint(nulls))
+		return " ".join([self._format(l.measurement, fieldval, nulls), outfields, self._format(l.timestamp, fieldval, nulls)])
+
+	def render(self, fieldval):
+		"""
+		Render query for one set of field values `fieldval` (dict).
+		"""
+		nulls = [f for f in self.allfields if fieldval.get(f) is None]
+		if not nulls:
+			return self._format((self.allfmt, self.fields), fieldval)
+		return "\n".join(self._render_line(l, fieldval, nulls) for l in self.lines)
+
+	@staticmethod
+	def _positional(fmt, names):
+		# Rewrite format string `fmt` to take the values of fields `names`
+		# as positional arguments, e.g. {T:.1f} to {0:.1f}
+		out = []
+		for literal, fname, spec, conv in string.Formatter().parse(fmt):
+			out.append(literal.replace('{', '{{').replace('}', '}}'))
+			if fname is not None:
+				root = re.match(r'[^.\[]*', fname).group(0)
+				out.append('{' + str(names.index(root)) + fname[len(root):] + ('!' + conv if conv else '') + (':' + spec if spec else '') + '}')
+		return ''.join(out)
+
+	def _format_rows(self, fmt, fields, columns, rows):
+		# Format `fmt` using `fields` for `rows` (array of indices) of
+		# `columns` (see render_columns()), which have no null fields. All
+		# rows are formatted in one map() call, without a dict per row.
+		names = sorted(fields)
+		args = [columns[fname][0][rows].tolist() if fname in columns else [None]*len(rows) for fname in names]
+		if not names:
+			return [fmt.format()]*len(rows)
+		try:
+			return list(map(self._positional(fmt, names).format, *args))
+		except (KeyError, ValueError, TypeError, IndexError, AttributeError):
+			# Bad format for some row, handle it like PartialFormatter
+			return [self._format((fmt, fields), dict(zip(names, vals))) for vals in zip(*args)]
+
+	def render_columns(self, columns, nrows):
+		"""
+		Render query for `nrows` rows at once, with field values `columns`
+		given as dict of field name to (values, nulls) tuples of numpy
+		arrays (values as objects, nulls as bool). Output is identical to
+		render() for each row, but rows without null fields are formatted
+		in one go, and rows with null fields line by line.
+		"""
+		import numpy as np
+		def nullmask(fields):
+			nulls = np.zeros(nrows, dtype=bool)
+			for fname in fields:
+				nulls |= columns[fname][1] if fname in columns else True
+			return nulls
+
+		nulls = nullmask(self.fields)
+		full = self._format_rows(self.allfmt, self.fields, columns, np.flatnonzero(~nulls))
+		if not nulls.any():
+			return full
+
+		# Render rows with null fields line by line, only lines with null
+		# fields one row at a time
+		rows = np.flatnonzero(nulls)
+		outlines = []
+		for l in self.lines:
+			linenulls = nullmask(l.fields)[rows]
+			linefull = iter(self._format_rows(l.fmt, l.fields, columns, rows[~linenulls]))
+			outline = []
+			for i, null in zip(rows.tolist(), linenulls.tolist()):
+				if not null:
+					outline.append(next(linefull))
+					continue
+				fieldval = {fname: columns[fname][0][i] if fname in columns else None for fname in l.fields}
+				outline.append(self._render_line(l, fieldval, [fname for fname, val in fieldval.items() if val is None]))
+			outlines.append(outline)
+
+		# Merge in original order
+		full, partial = iter(full), map("\n".join, zip(*outlines))
+		return [next(partial) if null else next(full) for null in nulls.tolist()]
+
+def parse_histrange(histrange=(21,)):
+	"""
+	Get (start, end) as YYYYMMDD strings from `histrange`, which is either
+	[days] since now or [start, end] as YYYYMMDD.
+	"""
 	if len(histrange) == 1:
 		histdays = int(histrange[0])
 		# Get data from last 21 days by default, explicitly determine end
@@ -125,57 +348,521 @@ def get_knmi_data_historical(knmistation=KNMISTATION, histrange=(21,)):
 	else:
 		my_logger.exception("Exception occurred")
 		raise ValueError("histrange should be either [days] or [start, end] and thus have 1 or 2 elements.")
+	return histstart, histend
+
+def parse_stations(stations):
+	"""
+	Get list of station ids (int) from `stations`, which can be a single
+	station, a list of stations (also as comma or colon separated strings)
+	or 'all'. Returns 'all' for all stations.
+	"""
+	if isinstance(stations, (int, str)):
+		stations = [stations]
+	parsed = []
+	for stn in stations:
+		for s in re.split('[,:]', str(stn)):
+			if s.lower() == 'all':
+				return 'all'
+			if s:
+				parsed.append(int(s))
+	return parsed
+
+def knmi_query(knmistation, histstart, histend):
+	# KNMI takes multiple stations separated by colon, or ALL
+	stations = parse_stations(knmistation)
+	stns = 'ALL' if stations == 'all' else ':'.join(str(stn) for stn in stations)
+	return "start={}01&end={}24&vars=ALL&stns={}".format(histstart, histend, stns)
+
+def get_knmi_data_historical(knmistation=KNMISTATION, histrange=(21,), stream=False, cachedir=None):
+	"""
+	Get KNMI hourly data for station(s) `knmistation` and `histrange` (see
+	parse_histrange()) as list of lines, or as line iterator reading the
+	response incrementally if `stream` is set. If `cachedir` is given, use
+	get_knmi_data_historical_cached() instead (not streamed).
+	"""
+	my_logger.debug("get_knmi_data_historical(knmistation={}, histrange={}, stream={})".format(knmistation, histrange, stream))
+	if cachedir:
+		return get_knmi_data_historical_cached(knmistation, histrange, cachedir)
+	histstart, histend = parse_histrange(histrange)
 	
-	knmiquery = "start={}01&end={}24&vars=ALL&stns={}".format(histstart, histend, knmistation)
+	knmiquery = knmi_query(knmistation, histstart, histend)
 	my_logger.info("get_knmi_data_historical(): getting query={}".format(knmiquery))
 
 	# Query can take quite long, set long-ish timeout
-	r = requests.post(KNMIURI, data=knmiquery, timeout=30)
+	r = http_session().post(KNMIURI, data=knmiquery, timeout=30, stream=stream)
+
+	if stream:
+		# Read response body incrementally instead of keeping it all in
+		# memory. KNMI does not always give an encoding, fall back to utf-8.
+		if r.encoding is None:
+			r.encoding = 'utf-8'
+		return r.iter_lines(chunk_size=STREAMCHUNKBYTES, decode_unicode=True)
 
 	# Return line-wise iterable for next stage
 	return r.text.splitlines()
 
-def get_knmi_data_actual(api_key, knmistation=KNMISTATION, query=DEFAULTQUERY):
-	my_logger.debug("get_knmi_data_actual(knmistation={}, query={})".format(knmistation, query))
-	# Get real-time data from now, store to disk (netCDF https support is limited)
+def http_session():
+	"""
+	Get requests.Session for the current thread, such that connections are
+	reused between requests (Session is not guaranteed to be thread-safe).
+	"""
+	if not hasattr(_threadlocal, 'session'):
+		_threadlocal.session = requests.Session()
+	return _threadlocal.session
 
-	# Old approach (deprecated)
-	# Latest:        https://data.knmi.nl/download/Actuele10mindataKNMIstations/1/noversion/2020/01/08/KMDS__OPER_P___10M_OBS_L2.nc
-	# Specific time: https://data.knmi.nl/download/Actuele10mindataKNMIstations/1/noversion/2020/01/08/KMDS__OPER_P___10M_OBS_L2_1620.nc
-	# https://stackoverflow.com/questions/22676/how-do-i-download-a-file-over-http-using-python/22776#22776
+def split_histrange(histstart, histend, windowdays):
+	"""
+	Split inclusive date range `histstart`-`histend` (YYYYMMDD) into
+	consecutive windows of at most `windowdays` days, return list of
+	(start, end) tuples as YYYYMMDD.
+	"""
+	start = datetime.datetime.strptime(histstart, "%Y%m%d")
+	end = datetime.datetime.strptime(histend, "%Y%m%d")
+	windows = []
+	while start <= end:
+		winend = min(start + datetime.timedelta(days=windowdays-1), end)
+		windows.append((start.strftime("%Y%m%d"), winend.strftime("%Y%m%d")))
+		start = winend + datetime.timedelta(days=1)
+	return windows
+
+def get_knmi_window(knmistation, histstart, histend, retries=3, timeout=30):
+	"""
+	Get KNMI hourly data for `histstart`-`histend` (YYYYMMDD) as list of
+	lines, retrying up to `retries` times with exponential backoff.
+	"""
+	knmiquery = knmi_query(knmistation, histstart, histend)
+	for attempt in range(retries+1):
+		try:
+			r = http_session().post(KNMIURI, data=knmiquery, timeout=timeout)
+			r.raise_for_status()
+			return r.text.splitlines()
+		except requests.RequestException as e:
+			if attempt == retries:
+				my_logger.error("get_knmi_window(): query={} failed after {} attempts: {}".format(knmiquery, attempt+1, e))
+				raise
+			my_logger.warning("get_knmi_window(): query={} failed, retrying: {}".format(knmiquery, e))
+			time.sleep(RETRYBACKOFF * 2**attempt)
+
+def get_knmi_data_historical_parallel(knmistation=KNMISTATION, histrange=(21,), windowdays=31, workers=4, retries=3):
+	"""
+	Like get_knmi_data_historical(), but split `histrange` into windows of
+	`windowdays` days which are fetched concurrently by `workers` threads.
+	Each window is retried on its own. Returns header from the first window
+	and data rows of all windows sorted by timestamp.
+	"""
+	my_logger.debug("get_knmi_data_historical_parallel(knmistation={}, histrange={}, windowdays={}, workers={})".format(knmistation, histrange, windowdays, workers))
+	histstart, histend = parse_histrange(histrange)
+	windows = split_histrange(histstart, histend, windowdays)
+	my_logger.info("get_knmi_data_historical_parallel(): getting {} windows for {}-{}".format(len(windows), histstart, histend))
+
+	with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+		futures = [executor.submit(get_knmi_window, knmistation, start, end, retries) for start, end in windows]
+		results = [f.result() for f in futures]
+
+	# Keep header (all lines up to the first data row) of first window only
+	header, datarows = [], []
+	for i, lines in enumerate(results):
+		for l in lines:
+			if l[:1] == "#" or ',' not in l:
+				if i == 0 and not datarows:
+					header.append(l)
+			else:
+				datarows.append(l)
+
+	# Windows are in order, but multi-station responses are sorted by
+	# station first, so sort on (YYYYMMDD, HH) explicitly. Sort is stable,
+	# so stations stay in order within one timestamp.
+	def rowtime(l):
+		_, yyyymmdd, hh = l.split(',', 3)[:3]
+		return yyyymmdd.strip(), int(hh)
+	datarows.sort(key=rowtime)
+	return header + datarows
+
+def knmi_days(histstart, histend):
+	"""
+	Get list of days (YYYYMMDD) from `histstart` to `histend` inclusive.
+	"""
+	start = datetime.datetime.strptime(histstart, "%Y%m%d")
+	ndays = (datetime.datetime.strptime(histend, "%Y%m%d") - start).days + 1
+	return [(start + datetime.timedelta(days=d)).strftime("%Y%m%d") for d in range(ndays)]
+
+def histcache_file(cachedir, stn, day):
+	return os.path.join(cachedir, 'historical', str(stn), '{}.csv.gz'.format(day))
+
+def histcache_read(cachefile, day, maxage, now):
+	"""
+	Get (column header, data rows) from historical cache file `cachefile`
+	for `day` (YYYYMMDD), or None if it does not exist or if it is not
+	final and older than `maxage` seconds.
+	"""
+	try:
+		fetched = os.stat(cachefile).st_mtime
+	except FileNotFoundError:
+		return None
+	dayend = datetime.datetime.strptime(day, "%Y%m%d").replace(tzinfo=datetime.timezone.utc) + datetime.timedelta(days=1)
+	final = fetched >= (dayend + datetime.timedelta(days=HISTCACHEFINAL)).timestamp()
+	if not final and now - fetched > maxage:
+		return None
+	with gzip.open(cachefile, 'rt') as fd:
+		lines = fd.read().splitlines()
+	# Keep track of last use for cache_evict(), mtime is the fetch time
+	os.utime(cachefile, (now, fetched))
+	return lines[0], lines[1:]
+
+def write_atomic(filename, data, opener=open, mode='w'):
+	"""
+	Write `data` to `filename` opened with `opener` and `mode` (e.g.
+	gzip.open and 'wt'). Writes to a unique temporary file first, such that
+	readers and concurrent runs never see partial files.
+	"""
+	tmpfile = "{}.{}.{}.tmp".format(filename, os.getpid(), threading.get_ident())
+	with opener(tmpfile, mode) as fd:
+		fd.write(data)
+	os.replace(tmpfile, filename)
+
+def histcache_write(cachefile, colheader, rows):
+	os.makedirs(os.path.dirname(cachefile), exist_ok=True)
+	write_atomic(cachefile, "\n".join([colheader] + rows) + "\n", gzip.open, 'wt')
+
+def cache_evict(cachedir, subdir, maxsize=None, maxage=None):
+	"""
+	Remove files from cache `subdir` (e.g. 'historical' or 'actual') in
+	`cachedir` that were not used for more than `maxage` seconds, then the
+	least recently used files until it is at most `maxsize` bytes.
+	"""
+	now = time.time()
+	files = []
+	for dirpath, _, filenames in os.walk(os.path.join(cachedir, subdir)):
+		for f in filenames:
+			try:
+				st = os.stat(os.path.join(dirpath, f))
+			except FileNotFoundError:
+				# Removed by a concurrent run
+				continue
+			files.append((st.st_atime, st.st_size, os.path.join(dirpath, f)))
+	files.sort()
+	total = sum(f[1] for f in files)
+	removed = 0
+	for used, size, path in files:
+		if (maxage is None or now - used <= maxage) and (maxsize is None or total <= maxsize):
+			break
+		try:
+			os.remove(path)
+		except FileNotFoundError:
+			pass
+		total -= size
+		removed += 1
+	if removed:
+		my_logger.info("cache_evict(): removed {} files, reduced {} cache to {} bytes".format(removed, subdir, total))
+
+def get_knmi_data_historical_cached(knmistation=KNMISTATION, histrange=(21,), cachedir='.', maxage=HISTCACHEMAXAGE, maxsize=None, windowdays=None, workers=1, retries=3):
+	"""
+	Like get_knmi_data_historical(), but keep data per station and day in
+	`cachedir`, and only get days from KNMI that are not cached, or that
+	are not final yet (see HISTCACHEFINAL) and were cached more than
+	`maxage` seconds ago. Days to get are queried in windows of at most
+	`windowdays` days by `workers` threads (see
+	get_knmi_data_historical_parallel()). If `maxsize` is given, the least
+	recently used days are removed from the cache until it is at most
+	`maxsize` bytes. For 'all' stations, KNMISTATIONS are used.
+	"""
+	my_logger.debug("get_knmi_data_historical_cached(knmistation={}, histrange={}, cachedir={})".format(knmistation, histrange, cachedir))
+	histstart, histend = parse_histrange(histrange)
+	stations = parse_stations(knmistation)
+	stations = sorted(KNMISTATIONS if stations == 'all' else set(stations))
+	days = knmi_days(histstart, histend)
+	now = time.time()
+
+	cached, missing = {}, []
+	for day in days:
+		daymissing = []
+		for stn in stations:
+			data = histcache_read(histcache_file(cachedir, stn, day), day, maxage, now)
+			if data is None:
+				daymissing.append(stn)
+			else:
+				cached[stn, day] = data
+		missing.append(tuple(daymissing))
+
+	# Get consecutive days missing the same stations in one query
+	queries = []
+	for daymissing, group in itertools.groupby(zip(missing, days), key=lambda m: m[0]):
+		if not daymissing:
+			continue
+		group = [day for _, day in group]
+		for start, end in split_histrange(group[0], group[-1], windowdays or len(group)):
+			queries.append((daymissing, start, end))
+	my_logger.info("get_knmi_data_historical_cached(): {} of {} station days cached, getting {} queries".format(len(cached), len(stations)*len(days), len(queries)))
+
+	with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+		futures = [executor.submit(get_knmi_window, daymissing, start, end, retries) for daymissing, start, end in queries]
+		results = [f.result() for f in futures]
 
+	header = []
+	for (daymissing, start, end), lines in zip(queries, results):
+		fetched = {(stn, day): [] for stn in daymissing for day in knmi_days(start, end)}
+		colheader = None
+		for l in lines:
+			if l[:1] == "#" or ',' not in l:
+				if colheader is None and "YYYYMMDD" in l:
+					colheader = l
+				continue
+			stn, day = (c.strip() for c in l.split(',', 2)[:2])
+			if (int(stn), day) in fetched:
+				fetched[int(stn), day].append(l)
+		if not header:
+			header = [l for l in lines if l[:1] == "#" or ',' not in l]
+		if colheader is None:
+			my_logger.warning("get_knmi_data_historical_cached(): no column header in KNMI data for {}-{}, not caching".format(start, end))
+		for (stn, day), rows in fetched.items():
+			if colheader is not None:
+				histcache_write(histcache_file(cachedir, stn, day), colheader, rows)
+			cached[stn, day] = (colheader, rows)
+
+	if not header:
+		# Everything cached, use column header such that data can be parsed
+		header = [next((c[0] for c in cached.values() if c[0]), "")]
+
+	if maxsize is not None:
+		cache_evict(cachedir, 'historical', maxsize)
+
+	# Same order as KNMI returns data, by station, then by time
+	datarows = []
+	for stn in stations:
+		for day in days:
+			datarows.extend(cached.get((stn, day), (None, []))[1])
+	return header + datarows
+
+def get_knmi_latest_filename(api_key):
+	"""
+	Get filename of latest 10-minute KNMI data file from KNMI Open Data API.
+	"""
 	# New approach 20200800: https://developer.dataplatform.knmi.nl/portal/example-scripts#list-10-files
 	# Get latest file with data
-	api_url = "https://api.dataplatform.knmi.nl/open-data"
-	dataset_name = "Actuele10mindataKNMIstations"
-	dataset_version = "2"
-
 	# Get the latest files since one hour ago, which should show 6 files (1 file per 10min). We take the last file of this, which should be the newest. Guaranteed to work if files are available max 1 hour later
 	timestamp_now = datetime.datetime.utcnow()
 	timestamp_one_hour_ago = timestamp_now - datetime.timedelta(hours=1)
 	filename_one_hour_ago = f"KMDS__OPER_P___10M_OBS_L2_{timestamp_one_hour_ago.strftime('%Y%m%d%H%M')}.nc"
-	list_files_response = requests.get(f"{api_url}/datasets/{dataset_name}/versions/{dataset_version}/files",
+	list_files_response = http_session().get(f"{KNMIAPIURI}/datasets/{KNMIDATASET}/versions/{KNMIDATASETVERSION}/files",
 		headers={"Authorization": api_key},
-		params={"maxKeys": 10, "startAfterFilename": filename_one_hour_ago})
+		params={"maxKeys": 10, "startAfterFilename": filename_one_hour_ago}, timeout=30)
 	list_files = list_files_response.json()
-	filename = list_files.get("files")[-1].get("filename")
+	return list_files.get("files")[-1].get("filename")
 
 	# Get latest file by constructing filename ourselves. Could fail if there's a delay before the files are available.
 	# timestamp_now = datetime.datetime.utcnow()
 	# timestamp_one_hour_ago = timestamp_now - timedelta(hours=1) - datetime.timedelta(minutes=timestamp_now.minute % 10)
 	# filename = f"KMDS__OPER_P___10M_OBS_L2_{timestamp_one_hour_ago.strftime('%Y%m%d%H%M')}.nc"
 
+def get_knmi_file_actual(api_key, filename, cachedir=None):
+	"""
+	Get 10-minute KNMI data file `filename` from KNMI Open Data API as bytes.
+	If `cachedir` is given, files are stored there by filename and read
+	from there if available, such that each file is downloaded only once.
+	See cache_evict() to limit the size of the cache.
+	"""
+	if cachedir:
+		cachefile = os.path.join(cachedir, 'actual', os.path.basename(filename))
+		try:
+			with open(cachefile, 'rb') as fd:
+				data = fd.read()
+		except FileNotFoundError:
+			data = None
+		if data is not None:
+			my_logger.debug("get_knmi_file_actual: using cached {}".format(cachefile))
+			# Keep track of last use for cache_evict()
+			with contextlib.suppress(FileNotFoundError):
+				os.utime(cachefile)
+			return data
+
 	# Get data file
-	endpoint = f"{api_url}/datasets/{dataset_name}/versions/{dataset_version}/files/{filename}/url"
-	my_logger.debug(f"get_knmi_data_actual: getting {endpoint}")
+	endpoint = f"{KNMIAPIURI}/datasets/{KNMIDATASET}/versions/{KNMIDATASETVERSION}/files/{filename}/url"
+	my_logger.debug(f"get_knmi_file_actual: getting {endpoint}")
 
-	get_file_response = requests.get(endpoint, headers={"Authorization": api_key})
+	get_file_response = http_session().get(endpoint, headers={"Authorization": api_key}, timeout=30)
 	download_url = get_file_response.json().get("temporaryDownloadUrl")
-	dataset_file = requests.get(download_url,)
-	urllib.request.urlretrieve(download_url, "/tmp/KMDS__OPER_P___10M_OBS_L2.nc")
+	dataset_file = http_session().get(download_url, timeout=60)
+	dataset_file.raise_for_status()
+
+	if cachedir:
+		os.makedirs(os.path.dirname(cachefile), exist_ok=True)
+		write_atomic(cachefile, dataset_file.content, mode='wb')
+
+	return dataset_file.content
+
+def get_knmi_data_actual(api_key, knmistation=KNMISTATION, query=DEFAULTQUERY, filename=None, cachedir=None, metrics=None, rollupstate=None):
+	"""
+	Get latest 10-minute KNMI data for station(s) `knmistation` (single
+	station, list of stations or 'all'), or from data file `filename` if
+	given. The data file contains all stations, so it is downloaded and
+	opened only once. See get_knmi_file_actual() for `cachedir`. Stages
+	are measured in `metrics` (RunMetrics) if given. If `rollupstate`
+	(RollupState) is given, updated rollups are added to the output.
+	"""
+	my_logger.debug("get_knmi_data_actual(knmistation={}, query={}, filename={})".format(knmistation, query, filename))
+	# Get real-time data from now. The file is opened from memory, such that
+	# we do not need temporary files.
+
+	# Old approach (deprecated)
+	# Latest:        https://data.knmi.nl/download/Actuele10mindataKNMIstations/1/noversion/2020/01/08/KMDS__OPER_P___10M_OBS_L2.nc
+	# Specific time: https://data.knmi.nl/download/Actuele10mindataKNMIstations/1/noversion/2020/01/08/KMDS__OPER_P___10M_OBS_L2_1620.nc
+	# https://stackoverflow.com/questions/22676/how-do-i-download-a-file-over-http-using-python/22776#22776
+
+	metrics = metrics or RunMetrics()
+	with metrics.stage('fetch'):
+		if filename is None:
+			filename = get_knmi_latest_filename(api_key)
+		data = get_knmi_file_actual(api_key, filename, cachedir)
+	metrics.add('fetch', bytes=len(data))
+
+	import netCDF4
+	with metrics.stage('open'):
+		rootgrp = netCDF4.Dataset(filename, "r", memory=data)
+	with rootgrp:
+		with metrics.stage('convert'):
+			influxdata = convert_knmi_actual(rootgrp, knmistation, query)
+		metrics.add('convert', rows=len(influxdata), points=sum(entry.count("\n")+1 for entry in influxdata))
+		if rollupstate is not None:
+			with metrics.stage('rollup'):
+				influxdata += rollupstate.update_actual(rootgrp, knmistation)
+	return influxdata
+
+def list_knmi_files_actual(api_key, histstart, histend):
+	"""
+	List filenames of 10-minute KNMI data files from `histstart` 00:00 up to
+	and including `histend` 23:50 (YYYYMMDD, UTC), paging through the KNMI
+	Open Data file listing.
+	"""
+	# Filenames sort by time, so list from just before the first file
+	prefix = "KMDS__OPER_P___10M_OBS_L2_"
+	first, last = prefix + histstart + "0000", prefix + histend + "2359"
+	params = {"maxKeys": 500, "startAfterFilename": first}
+	filenames = []
+	while True:
+		r = http_session().get(f"{KNMIAPIURI}/datasets/{KNMIDATASET}/versions/{KNMIDATASETVERSION}/files",
+			headers={"Authorization": api_key}, params=params, timeout=30)
+		r.raise_for_status()
+		listing = r.json()
+		for f in listing.get("files", []):
+			if f.get("filename") > last:
+				return filenames
+			filenames.append(f.get("filename"))
+		if not listing.get("isTruncated") or not listing.get("nextPageToken"):
+			return filenames
+		params["nextPageToken"] = listing.get("nextPageToken")
+
+def iter_bounded(executor, func, argtuples, inflight):
+	"""
+	Like executor.map(), but submit func(*args) for each of `argtuples`
+	(any iterable) only when fewer than `inflight` calls are pending, such
+	that inputs and results are not all kept in memory. Yields results in
+	order.
+	"""
+	pending = collections.deque()
+	for args in argtuples:
+		pending.append(executor.submit(func, *args))
+		if len(pending) >= inflight:
+			yield pending.popleft().result()
+	while pending:
+		yield pending.popleft().result()
+
+def _convert_knmi_file_actual(filename, data, knmistation, query):
+	# Convert one netCDF file given as bytes, for use in a process pool
+	import netCDF4
+	with netCDF4.Dataset(filename, "r", memory=data) as rootgrp:
+		return convert_knmi_actual(rootgrp, knmistation, query, verbose=False)
+
+def get_knmi_data_actual_backfill(api_key, knmistation=KNMISTATION, query=DEFAULTQUERY, histrange=(1,), workers=4, processes=None, cachedir=None):
+	"""
+	Get all 10-minute KNMI data in `histrange` (see parse_histrange()), e.g.
+	to fill in runs that were missed. Files are downloaded by `workers`
+	threads (only those not in `cachedir` yet, if given) and converted by
+	`processes` processes (default: number of CPUs, 0 to convert in this
+	process). Yields line protocol entries ordered by file time.
+	"""
+	my_logger.debug("get_knmi_data_actual_backfill(knmistation={}, histrange={}, workers={}, processes={})".format(knmistation, histrange, workers, processes))
+	histstart, histend = parse_histrange(histrange)
+	filenames = list_knmi_files_actual(api_key, histstart, histend)
+	my_logger.info("get_knmi_data_actual_backfill(): getting {} files for {}-{}".format(len(filenames), histstart, histend))
+
+	def download(filename):
+		return filename, get_knmi_file_actual(api_key, filename, cachedir)
+
+	with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as downloader:
+		# Download concurrently but get files in order, keeping only a few
+		# files in memory that are not converted yet
+		files = iter_bounded(downloader, download, ((f,) for f in filenames), 2*workers)
+		if processes == 0:
+			for filename, data in files:
+				yield from _convert_knmi_file_actual(filename, data, knmistation, query)
+			return
+		# Spawn instead of fork, forking while download threads run is unsafe
+		with concurrent.futures.ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context('spawn')) as converter:
+			convert = functools.partial(_convert_knmi_file_actual, knmistation=knmistation, query=query)
+			for outlines in iter_bounded(converter, convert, files, 2*(processes or os.cpu_count())):
+				yield from outlines
+
+# Fields available in the query for actual data, in addition to all
+# variables in the data file by their name (e.g. {rh}, {ww}), as
+# (variable, conversion function), such that they match the historical data.
+ACTUALFIELDS = {
+	'T':  ('ta', None),
+	'FF': ('ff', None),
+	'FX': ('gff', None),
+	'DD': ('dd', None),
+	'Q':  ('qg', None),
+	# 'SQ': ('gq', None),
+	# 'DR': ('dr', lambda x: x/600.), # seconds to fraction
+	'DR': ('D1H', lambda x: x/60.), # minutes to fraction
+	'RH': ('R1H', None),
+	'P':  ('pp', None),
+}
+
+def knmi_actual_time(rootgrp):
+	"""
+	Get observation time of netCDF dataset `rootgrp` in seconds since epoch.
+	"""
+	import netCDF4
+
+	# time units is: seconds since 1950-01-01 00:00:00
+	naivetime = netCDF4.num2date(rootgrp["/time"][:], rootgrp["/time"].units)[0]
+	# Cumbersome way to make into utc timestamp
+	obstime = datetime.datetime(naivetime.year, naivetime.month, naivetime.day, naivetime.hour, naivetime.minute, tzinfo=datetime.timezone.utc)
+	return int(obstime.timestamp())
 
-	rootgrp = netCDF4.Dataset("/tmp/KMDS__OPER_P___10M_OBS_L2.nc", "r", format="NETCDF4")
+def knmi_actual_columns(rootgrp, fields, fieldmap=ACTUALFIELDS):
+	"""
+	Read variables needed for `fields` (names from `fieldmap` or netCDF
+	variables with a station dimension) from netCDF dataset `rootgrp`, each
+	in one read. Returns dict of field name to list of values per station
+	index, None for masked values.
+	"""
+	import numpy as np
+
+	columns = {}
+	for fname in fields:
+		varname, func = fieldmap.get(fname, (fname, None))
+		if varname not in rootgrp.variables or rootgrp[varname].dimensions[:1] != ('station',):
+			continue
+		values = rootgrp[varname][:]
+		# Take first (only) time for (station, time) variables
+		if values.ndim > 1:
+			values = values[:,0]
+		if func is not None:
+			values = func(values)
+		# Keep numpy scalars such that formatting is identical to indexing
+		# the variable per station, stations do not measure all variables
+		# so leave out masked values
+		mask = np.ma.getmaskarray(values)
+		columns[fname] = [None if m else v for v, m in zip(np.ma.getdata(values), mask)]
+	return columns
 
+def convert_knmi_actual(rootgrp, knmistation, query, verbose=True):
+	"""
+	Convert KNMI 10-minute netCDF dataset `rootgrp` for station(s)
+	`knmistation` to influxdb line protocol using `query`, one entry per
+	station. If `verbose`, print each entry.
+	"""
 	# Data file contains the following variables:
 	# for k, v in rootgrp.variables.items():
 	# 	try:
@@ -236,42 +923,76 @@ def get_knmi_data_actual(api_key, knmistation=KNMISTATION, query=DEFAULTQUERY):
 	# product, unit: 1, name: ADAGUC Data Products Standard
 	# projection
 
-	# Get number of stations, then get station by station id.
-	nstations = rootgrp.dimensions['station'].size
-	stationid = [(rootgrp["/station"][i]) for i in range(nstations)].index("06"+str(knmistation))
+	# Map station id to index once, station ids are like '06260'.
+	stationidx = {str(stn): i for i, stn in enumerate(rootgrp["/station"][:])}
+	stations = parse_stations(knmistation)
+	if stations == 'all':
+		stations = [int(stn[2:]) for stn in stationidx]
 
-	fieldval = {'NEWLINE':"\n"}
-	# time units is: seconds since 1950-01-01 00:00:00
-	naivetime = netCDF4.num2date(rootgrp["/time"][:], rootgrp["/time"].units)[0]
-	# Cumbersome way to make into utc timestamp
-	obstime = datetime.datetime(naivetime.year, naivetime.month, naivetime.day, naivetime.hour, naivetime.minute, tzinfo=datetime.timezone.utc)
-	fieldval['DATETIME'] = int(obstime.timestamp())
-	# tzinfo=datetime.timezone.utc
-	fieldval['STN'] = knmistation
-	fieldval['T'] = rootgrp["/ta"][stationid][0]
-	fieldval['FF'] = rootgrp["/ff"][stationid][0]
-	fieldval['FX'] = rootgrp["/gff"][stationid][0]
-	fieldval['DD'] = rootgrp["/dd"][stationid][0]
-	fieldval['Q'] = rootgrp["/qg"][stationid][0]
-	# fieldval['SQ'] = rootgrp["/gq"][stationid]
-	# fieldval['DR'] = rootgrp["/dr"][stationid][0]/600. # seconds to fraction
-	fieldval['DR'] = rootgrp["/D1H"][stationid][0]/60. # minutes to fraction
-	fieldval['RH'] = rootgrp["/R1H"][stationid][0]
-	fieldval['P'] = rootgrp["/pp"][stationid][0]
-
-	fmt = PartialFormatter()
-	outline = fmt.format(query, **fieldval)
-	print(outline)
+	obstime = knmi_actual_time(rootgrp)
+
+	compiled = CompiledQuery(query)
+	columns = knmi_actual_columns(rootgrp, compiled.fields)
+	outlines = []
+	for stn in stations:
+		try:
+			stationid = stationidx["06"+str(stn)]
+		except KeyError:
+			my_logger.error("Station {} not found in KNMI data file.".format(stn))
+			continue
+
+		fieldval = {fname: values[stationid] for fname, values in columns.items()}
+		fieldval['DATETIME'] = obstime
+		# tzinfo=datetime.timezone.utc
+		fieldval['STN'] = stn
+
+		outline = compiled.render(fieldval)
+		if verbose:
+			print(outline)
+		outlines.append(outline)
 
 	# Return as array so we're compatible with convert_knmi() format (which 
 	# returns multiple lines)
-	return [outline]
+	return outlines
 
-def convert_knmi(knmidata, query):
-	my_logger.debug("convert_knmi(knmidata, query={})".format(query))
+# Fields we parse from the KNMI hourly data, STN is always the first column
+KNMIFIELDS = ('STN', 'YYYYMMDD', 'HH', 'DD', 'FF', 'FX', 'T', 'SQ', 'Q', 'DR', 'RH', 'P')
+
+def knmi_fieldpos(row):
+	"""
+	Get column position of KNMIFIELDS from KNMI header `row` (list of column
+	names), raise ValueError if a field is missing.
+	"""
+	fieldpos = {'STN': 0}
+	for fname in KNMIFIELDS[1:]:
+		fieldpos[fname] = row.index(fname)
+	return fieldpos
+
+def knmi_header(r):
+	"""
+	Get column position of KNMIFIELDS (see knmi_fieldpos()) if KNMI data
+	line `r` is the column header, else None. Raise ValueError if the
+	header lacks any of the fields.
+	"""
+	# Header should be like # STN,YYYYMMDD,   HH,   DD,   FH,   FF,   FX,    T,  T10,   TD,   SQ,    Q,   DR,   RH,    P,   VV,    N,    U,   WW,   IX,    M,    R,    S,    O,    Y
+	row = r.replace(' ','').split(',')
+	if not (row[0][:1] == "#" and len(row)>2 and "YYYYMMDD" in row[1]):
+		return None
+	try:
+		fieldpos = knmi_fieldpos(row)
+	except ValueError as e:
+		my_logger.exception("KNMI data file incompatible, could not find fields HH, DD or others: {}".format(row))
+		raise ValueError("KNMI data file incompatible, could not find fields HH, DD or others: {}".format(e))
+	my_logger.debug("Started on row: {}".format(r))
+	return fieldpos
+
+def knmi_records(knmidata):
+	"""
+	Parse KNMI hourly CSV lines `knmidata`, yield a dict of converted field
+	values per data row.
+	"""
 	start = False
 	fieldpos = {}
-	fieldval = {'NEWLINE':"\n"}
 	fieldfunc = {
 		'YYYYMMDD': lambda x: datetime.datetime(int(x[0:4]), int(x[4:6]), int(x[6:8]), tzinfo=datetime.timezone.utc), ## time
 		'HH':  lambda x: int(x),
@@ -285,37 +1006,20 @@ def convert_knmi(knmidata, query):
 		'RH': lambda x: max(int(x),0)/10, # RH is values? From their doc: RH       = Uursom van de neerslag (in 0.1 mm) (-1 voor <0.05 mm); 
 		'P':  lambda x: int(x)/10,
 	}
-	parsed_lines = []
-	fmt=PartialFormatter()
 
 	for r in knmidata:
 		row = r.replace(' ','').split(',')
 		
-		# Find start row (syntax should be like # STN,YYYYMMDD,   HH,   DD,   FH,   FF,   FX,    T,  T10,   TD,   SQ,    Q,   DR,   RH,    P,   VV,    N,    U,   WW,   IX,    M,    R,    S,    O,    Y)
-		if (row[0][0] == "#" and len(row)>2 and "YYYYMMDD" in row[1] and not start):
-			try:
-				fieldpos['STN'] = 0
-				fieldpos['YYYYMMDD'] = row.index("YYYYMMDD")
-				fieldpos['HH'] = row.index("HH")
-				fieldpos['DD'] = row.index("DD")
-				fieldpos['FF'] = row.index("FF")
-				fieldpos['FX'] = row.index("FX")
-				fieldpos['T'] = row.index("T")
-				fieldpos['SQ'] = row.index("SQ")
-				fieldpos['Q'] = row.index("Q")
-				fieldpos['DR'] = row.index("DR")
-				fieldpos['RH'] = row.index("RH")
-				fieldpos['P'] = row.index("P")
-			except ValueError as e:
-				my_logger.exception("KNMI data file incompatible, could not find fields HH, DD or others: {}".format(row))
-				quit("KNMI data file incompatible, could not find fields HH, DD or others: {}".format(e))
-			start = True
-			my_logger.debug("Started on row: {}".format(r))
+		# Find start row, see knmi_header()
+		if (not start):
+			fieldpos = knmi_header(r)
+			start = fieldpos is not None
 
 		# After we found the start marker, parse data.
-		elif (start and len(row) > 1):
+		elif (len(row) > 1):
 			# valstn = row[0]
 			# valyyyymmdd = row[1]
+			fieldval = {}
 			for fname, pos in fieldpos.items():
 				try:
 					# Apply conversion function to each field's value,
@@ -338,50 +1042,711 @@ def convert_knmi(knmidata, query):
 			# N.B. timestamp() only works in python3
 			fieldval['DATETIME'] = int((fieldval['YYYYMMDD'] + datetime.timedelta(hours=fieldval['HH'])).timestamp())
 
-			# Unpack dict to format query to give influxdb line protocol "value=X"
-			# See https://github.com/influxdata/docs.influxdata.com/issues/717#issuecomment-249618099
-			outline = fmt.format(query, **fieldval)
-			# Influxdb does not recognize None or null as values, instead 
-			# remove fields by filtering out all ~~ values given by PartialFormatter().
-			outline_fix = []
-			for l in outline.split('\n'):
-				# First get field sets by splitting by space into three parts (https://docs.influxdata.com/influxdb/v1.7/write_protocols/line_protocol_tutorial/)
-				try:
-					outline_meas, outline_field, outline_time = l.split(' ')
-				except:
-					my_logger.exception("Could not unpack line: {}".format(l))
-
-				# Replace None values
-				outline_field = ','.join([w for w in outline_field.split(',') if not '~~' in w])
-				outline_fix.append(" ".join([outline_meas, outline_field, outline_time]))
-
-			# Store
-			parsed_lines.append("\n".join(outline_fix))
+			yield fieldval
 
 		# If we found nothing (during initialization), we continue to next 
 		# line (added for clarity)
 		else:
 			continue
 
-	return parsed_lines
+def convert_knmi(knmidata, query):
+	"""
+	Convert KNMI hourly data lines `knmidata` to list of influxdb line
+	protocol entries using `query`, one entry per row.
+	"""
+	my_logger.debug("convert_knmi(knmidata, query={})".format(query))
+	return list(iter_convert_knmi(knmidata, query))
+
+def iter_convert_knmi(knmidata, query):
+	"""
+	Generator version of convert_knmi(), converting one row at a time such
+	that `knmidata` can be streamed.
+	"""
+	# Render compiled query to give influxdb line protocol "value=X",
+	# leaving out fields with None values.
+	# See https://github.com/influxdata/docs.influxdata.com/issues/717#issuecomment-249618099
+	compiled = CompiledQuery(query)
+	for fieldval in knmi_records(knmidata):
+		yield compiled.render(fieldval)
+
+# Columnar equivalents of the conversions in knmi_records(), applied to
+# complete (masked) arrays at once.
+KNMICOLUMNFUNC = {
+	'FF': lambda x: x/10,
+	'FX': lambda x: x/10,
+	'T':  lambda x: x/10,
+	'SQ': lambda x: x/10,
+	'Q':  lambda x: x*10000/3600, # Convert J/cm^2/hour to W/m^2
+	'DR': lambda x: x/10,
+	'RH': lambda x: x.clip(0, None)/10, # -1 means <0.05 mm
+	'P':  lambda x: x/10,
+}
+# Placeholder for empty cells, KNMI data are all small integers
+KNMIEMPTY = -2**62
+
+def knmi_columns(knmidata):
+	"""
+	Parse KNMI hourly CSV lines `knmidata` in one pass using numpy, return
+	dict of masked arrays (masked for empty cells) for KNMIFIELDS, with the
+	same unit conversions as knmi_records(), plus DATETIME in seconds since
+	epoch. N.B. YYYYMMDD is returned as integer, not as datetime.
+	"""
+	import numpy as np
+	fieldpos = None
+	datalines = []
+	for r in knmidata:
+		if fieldpos is None:
+			fieldpos = knmi_header(r)
+		elif r[:1] != "#" and ',' in r:
+			datalines.append(r)
+
+	if fieldpos is None or not datalines:
+		return {fname: np.ma.zeros(0, dtype=np.int64) for fname in KNMIFIELDS + ('DATETIME',)}
+
+	# Fill empty cells with placeholder such that numpy's C parser can read
+	# everything as int. Replace twice to catch consecutive empty cells.
+	empty = ',{},'.format(KNMIEMPTY)
+	text = "\n".join(datalines).replace(' ', '').replace(',,', empty).replace(',,', empty)
+	text = text.replace(',\n', ',{}\n'.format(KNMIEMPTY))
+	if text.endswith(','):
+		text += str(KNMIEMPTY)
+
+	usecols = [fieldpos[fname] for fname in KNMIFIELDS]
+	data = np.loadtxt(io.StringIO(text), delimiter=',', dtype=np.int64, usecols=usecols, ndmin=2)
+
+	columns = {}
+	for i, fname in enumerate(KNMIFIELDS):
+		col = np.ma.masked_equal(data[:,i], KNMIEMPTY)
+		columns[fname] = KNMICOLUMNFUNC.get(fname, lambda x: x)(col)
+
+	# Get timestamp from date and hour fields, see knmi_records() for the
+	# HH=1..24 convention. Convert YYYYMMDD to days since epoch via
+	# datetime64 arithmetic, without constructing datetime objects.
+	ymd = data[:,1]
+	days = ((ymd//10000 - 1970).astype('datetime64[Y]').astype('datetime64[M]') + (ymd//100 % 100 - 1)).astype('datetime64[D]') + (ymd % 100 - 1)
+	columns['DATETIME'] = np.ma.masked_array(days.astype(np.int64)*86400 + data[:,2]*3600)
+
+	return columns
+
+def convert_knmi_columnar(knmidata, query):
+	"""
+	Like convert_knmi(), but parse `knmidata` with knmi_columns() and
+	render `query` for all rows at once with CompiledQuery.render_columns(),
+	which is faster for large datasets. Output is identical to convert_knmi().
+	"""
+	import numpy as np
+	my_logger.debug("convert_knmi_columnar(knmidata, query={})".format(query))
+	columns = knmi_columns(knmidata)
+	compiled = CompiledQuery(query)
+	nrows = len(columns['DATETIME'])
+
+	# Only convert columns used in the query to Python values, with the
+	# same types as knmi_records(). tolist() gives None for masked (empty)
+	# values, such that these are left out.
+	values = {}
+	for fname in compiled.fields:
+		if fname not in columns:
+			continue
+		col = columns[fname]
+		if fname == 'STN':
+			vals = [None if v is None else str(v) for v in col.tolist()]
+		elif fname == 'YYYYMMDD':
+			vals = [None if v is None else datetime.datetime(v//10000, v//100 % 100, v % 100, tzinfo=datetime.timezone.utc) for v in col.tolist()]
+		else:
+			vals = col.tolist()
+		values[fname] = (np.array(vals, dtype=object), np.ma.getmaskarray(col))
+	return compiled.render_columns(values, nrows)
+
+# Aggregates per field for rollups, and rollup periods with their length in
+# days. Weekly periods start on Monday.
+ROLLUPFIELDS = {'T': ('min', 'max', 'mean'), 'RH': ('sum',), 'Q': ('mean',), 'FF': ('mean',), 'FX': ('max',)}
+ROLLUPPERIODS = {'daily': 1, 'weekly': 7}
+# For actual data, RH is rain in the last hour, use rain intensity (mm/h)
+# averaged over 10 minutes instead such that it can be summed
+ROLLUPACTUALFIELDS = dict(ACTUALFIELDS, RH=('rg', lambda x: x/6.))
+
+def rollup_bucket(days, period):
+	# Get first day of rollup period containing `days` (days since epoch),
+	# 1970-01-01 was a Thursday
+	if ROLLUPPERIODS[period] == 7:
+		return days - (days + 3) % 7
+	return days
+
+def knmi_rollup(stations, days, columns):
+	"""
+	Aggregate observations per station, rollup period (ROLLUPPERIODS) and
+	field (ROLLUPFIELDS), given as arrays of station ids `stations`, day of
+	observation in days since epoch `days` and dict of masked arrays per
+	field `columns`. Returns dict of (period, station, first day of period)
+	to dict of field to [count, sum, min, max], ignoring masked values.
+	"""
+	import numpy as np
+	rollups = {}
+	if len(days) == 0:
+		return rollups
+	# Combine station and day (offset such that days before 1970 are
+	# positive as well) into one key to group on
+	for period in ROLLUPPERIODS:
+		keys = np.asarray(stations, dtype=np.int64)*1000000 + rollup_bucket(np.asarray(days, dtype=np.int64), period) + 100000
+		order = np.argsort(keys, kind='stable')
+		ukeys, starts = np.unique(keys[order], return_index=True)
+		aggs = {}
+		for fname in ROLLUPFIELDS:
+			col = np.ma.asarray(columns[fname])[order]
+			mask = np.ma.getmaskarray(col)
+			data = np.ma.getdata(col).astype(float)
+			aggs[fname] = [np.add.reduceat((~mask).astype(np.int64), starts).tolist(),
+				np.add.reduceat(np.where(mask, 0., data), starts).tolist(),
+				np.minimum.reduceat(np.where(mask, np.inf, data), starts).tolist(),
+				np.maximum.reduceat(np.where(mask, -np.inf, data), starts).tolist()]
+		for i, key in enumerate(ukeys.tolist()):
+			rollups[period, key // 1000000, key % 1000000 - 100000] = {fname: [agg[i] for agg in a] for fname, a in aggs.items()}
+	return rollups
+
+def rollup_lines(rollups, source):
+	"""
+	Get influxdb line protocol entries for `rollups` (see knmi_rollup()),
+	one per station and period as measurement knmi_<period> (e.g.
+	knmi_daily) with tags source=knmi<station> and data=`source`, fields
+	like T_min and RH_sum, and time at the start of the period.
+	"""
+	outlines = []
+	for (period, stn, day), aggs in sorted(rollups.items()):
+		fields = []
+		for fname, (count, total, vmin, vmax) in aggs.items():
+			if not count:
+				continue
+			values = {'min': vmin, 'max': vmax, 'sum': total, 'mean': total/count}
+			fields.extend("{}_{}={:.2f}".format(fname, agg, values[agg]) for agg in ROLLUPFIELDS[fname])
+		if fields:
+			outlines.append("knmi_{},source=knmi{},data={} {} {}".format(period, stn, source, ",".join(fields), day*86400))
+	return outlines
+
+def rollup_knmi(knmidata):
+	"""
+	Get daily and weekly rollups of KNMI hourly data lines `knmidata` as
+	influxdb line protocol entries, see rollup_lines(). Periods not
+	completely in `knmidata` give rollups of the available data only.
+	"""
+	my_logger.debug("rollup_knmi(knmidata)")
+	columns = knmi_columns(knmidata)
+	# Hour 24 is at 00:00 the next day, but belongs to day YYYYMMDD
+	days = (columns['DATETIME'].data - 1)//86400
+	return rollup_lines(knmi_rollup(columns['STN'].data, days, columns), 'historical')
+
+def rollup_histrange(histrange):
+	"""
+	Get `histrange` with start moved back to the start of its week, such
+	that rollups of all periods in the range are complete.
+	"""
+	histstart, histend = parse_histrange(histrange)
+	start = datetime.datetime.strptime(histstart, "%Y%m%d")
+	return (start - datetime.timedelta(days=start.weekday())).strftime("%Y%m%d"), histend
+
+class RollupState:
+	"""
+	Keep rollups of actual data in state file `statefile` (JSON), such that
+	each 10-minute data file only updates the rollups of its periods. Only
+	recent periods are kept.
+	"""
+	def __init__(self, statefile):
+		self.statefile = statefile
+		self.rollups, self.last = {}, {}
+		if os.path.exists(statefile):
+			with open(statefile) as fd:
+				state = json.load(fd)
+			self.rollups = {(period, int(stn), int(day)): aggs for period, stn, day, aggs in state['rollups']}
+			self.last = {int(stn): ts for stn, ts in state['last'].items()}
+
+	def update_actual(self, rootgrp, knmistation):
+		"""
+		Add observations of netCDF dataset `rootgrp` for station(s)
+		`knmistation` to rollups, skipping stations for which this or a later
+		file was added already. Returns line protocol entries of the updated
+		rollups, see rollup_lines().
+		"""
+		import numpy as np
+		obstime = knmi_actual_time(rootgrp)
+		stationidx = {int(str(stn)[2:]): i for i, stn in enumerate(rootgrp["/station"][:])}
+		stations = parse_stations(knmistation)
+		if stations == 'all':
+			stations = list(stationidx)
+		stations = [stn for stn in stations if stn in stationidx and self.last.get(stn, -1) < obstime]
+		if not stations:
+			return []
+
+		columns = knmi_actual_columns(rootgrp, ROLLUPFIELDS, ROLLUPACTUALFIELDS)
+		idx = [stationidx[stn] for stn in stations]
+		for fname in ROLLUPFIELDS:
+			values = [columns[fname][i] if fname in columns else None for i in idx]
+			columns[fname] = np.ma.masked_array([0. if v is None else float(v) for v in values], mask=[v is None for v in values])
+		# 00:00 belongs to the previous day, as for historical data
+		days = np.full(len(stations), (obstime - 1)//86400)
+		rollups = knmi_rollup(stations, days, columns)
+
+		for key, aggs in rollups.items():
+			old = self.rollups.get(key)
+			if old is not None:
+				for fname, (count, total, vmin, vmax) in aggs.items():
+					ocount, ototal, omin, omax = old[fname]
+					aggs[fname] = [ocount + count, ototal + total, min(omin, vmin), max(omax, vmax)]
+			self.rollups[key] = aggs
+		for stn in stations:
+			self.last[stn] = obstime
+
+		# Keep current and previous periods only
+		oldest = (obstime - 1)//86400 - 2*max(ROLLUPPERIODS.values())
+		self.rollups = {key: aggs for key, aggs in self.rollups.items() if key[2] >= oldest}
+		self.save()
+		return rollup_lines(rollups, 'actual')
+
+	def save(self):
+		state = {'rollups': [[period, stn, day, aggs] for (period, stn, day), aggs in sorted(self.rollups.items())],
+			'last': {str(stn): ts for stn, ts in sorted(self.last.items())}}
+		write_atomic(self.statefile, json.dumps(state))
+
+def _convert_knmi_shard(colheader, rows, query, parser):
+	# Convert one shard of KNMI data rows with column header, for use in a
+	# process pool
+	if parser == 'columnar':
+		return convert_knmi_columnar([colheader] + rows, query)
+	return convert_knmi([colheader] + rows, query)
+
+def iter_convert_knmi_parallel(knmidata, query, processes=None, shardrows=KNMISHARDROWS, parser='rows'):
+	"""
+	Like iter_convert_knmi(), but split data rows of `knmidata` in shards
+	of `shardrows` rows, which are converted by `processes` processes
+	(default: number of CPUs) with `parser` ('rows' or 'columnar'). Output
+	is identical to and in the same order as for the serial conversion.
+	"""
+	my_logger.debug("iter_convert_knmi_parallel(knmidata, query={}, processes={}, shardrows={})".format(query, processes, shardrows))
+	# Find column header once, every shard gets a copy of it
+	knmidata = iter(knmidata)
+	colheader = None
+	for r in knmidata:
+		if knmi_header(r) is not None:
+			colheader = r
+			break
+	if colheader is None:
+		return
+
+	processes = processes or os.cpu_count()
+	shards = chunks((r for r in knmidata if r[:1] != "#" and ',' in r), shardrows)
+	# Spawn instead of fork, like get_knmi_data_actual_backfill()
+	with concurrent.futures.ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context('spawn')) as executor:
+		# Keep a limited number of shards in flight, such that streamed
+		# input is not read completely into memory
+		for outlines in iter_bounded(executor, _convert_knmi_shard, ((colheader, shard, query, parser) for shard in shards), 2*processes):
+			yield from outlines
+
+def iter_pipeline(items, stages, queuesize=PIPELINEQUEUE):
+	"""
+	Apply each function of `stages` in turn to `items` (any iterable), with
+	getting items and every stage in a separate thread, connected by queues
+	of at most `queuesize` items, such that all stages run concurrently
+	while slower stages hold back faster ones. Yields the results of the
+	last stage in order. An exception in any stage is raised here.
+	"""
+	done = object()
+	stop = threading.Event()
+	queues = [queue.Queue(maxsize=queuesize) for _ in range(len(stages)+1)]
+
+	# Wait in short intervals, such that threads end when the consumer
+	# stopped (e.g. on an exception) instead of blocking forever
+	def put(q, item):
+		while not stop.is_set():
+			try:
+				q.put(item, timeout=0.1)
+				return True
+			except queue.Full:
+				pass
+		return False
+
+	def get(q):
+		while not stop.is_set():
+			try:
+				return q.get(timeout=0.1)
+			except queue.Empty:
+				pass
+		return done, None
+
+	def source():
+		try:
+			for item in items:
+				if not put(queues[0], (item, None)):
+					return
+		except Exception as e:
+			put(queues[0], (None, e))
+			return
+		put(queues[0], (done, None))
+
+	def stage(func, qin, qout):
+		while True:
+			item, exc = get(qin)
+			if item is not done and exc is None:
+				try:
+					item = func(item)
+				except Exception as e:
+					item, exc = None, e
+			if not put(qout, (item, exc)) or item is done or exc is not None:
+				return
+
+	threads = [threading.Thread(target=source, daemon=True)]
+	threads += [threading.Thread(target=stage, args=(func, queues[i], queues[i+1]), daemon=True) for i, func in enumerate(stages)]
+	for t in threads:
+		t.start()
+	try:
+		while True:
+			item, exc = queues[-1].get()
+			if exc is not None:
+				raise exc
+			if item is done:
+				return
+			yield item
+	finally:
+		stop.set()
+
+def get_knmi_data_historical_pipeline(knmistation=KNMISTATION, histrange=(21,), query=DEFAULTQUERY, windowdays=31, workers=1, retries=3, parser='rows', cachedir=None, cachemaxage=HISTCACHEMAXAGE, watermark=None, queuesize=PIPELINEQUEUE):
+	"""
+	Get and convert KNMI hourly data in windows of `windowdays` days in a
+	pipeline (see iter_pipeline()): while the caller writes the entries of
+	one window, the next window is converted with `parser` ('rows' or
+	'columnar'), and the windows after that are fetched by `workers`
+	threads (from `cachedir` if given, see
+	get_knmi_data_historical_cached()). Yields line protocol entries in
+	order of windows. Rows are filtered by `watermark` (Watermark) if given.
+	"""
+	my_logger.debug("get_knmi_data_historical_pipeline(knmistation={}, histrange={}, windowdays={}, workers={})".format(knmistation, histrange, windowdays, workers))
+	histstart, histend = parse_histrange(histrange)
+	windows = split_histrange(histstart, histend, windowdays)
+	my_logger.info("get_knmi_data_historical_pipeline(): getting {} windows for {}-{}".format(len(windows), histstart, histend))
+
+	def fetch(window):
+		if cachedir:
+			return get_knmi_data_historical_cached(knmistation, window, cachedir, maxage=cachemaxage, retries=retries)
+		return get_knmi_window(knmistation, window[0], window[1], retries)
+
+	def fetched():
+		# Keep `workers` windows in flight, get results in order
+		with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+			yield from iter_bounded(executor, fetch, ((window,) for window in windows), workers)
+
+	def convert(knmidata):
+		if watermark is not None:
+			knmidata = watermark.filter(knmidata)
+		if parser == 'columnar':
+			return convert_knmi_columnar(knmidata, query)
+		return convert_knmi(knmidata, query)
+
+	for influxdata in iter_pipeline(fetched(), [convert], queuesize):
+		yield from influxdata
+
+def chunks(iterable, size):
+	"""
+	Yield lists of at most `size` items from `iterable`.
+	"""
+	iterator = iter(iterable)
+	while True:
+		chunk = list(itertools.islice(iterator, size))
+		if not chunk:
+			return
+		yield chunk
+
+class InfluxWriter:
+	"""
+	Write line protocol to influxdb server `outuri` in batches of
+	`batchsize` entries over one pooled session, optionally gzip-compressed.
+	Batches failing with 429/5xx or connection errors are retried with
+	exponential backoff, and if that fails spilled to `journaldir` (if
+	given), from where replay() writes them on a next run. Batches rejected
+	with other 4xx errors (e.g. malformed data) are logged and dropped.
+	"""
+	def __init__(self, outuri, influxusername=None, influxpassword=None, batchsize=INFLUXBATCHSIZE, compress=True, retries=5, timeout=10, journaldir=None):
+		self.outuri, self.batchsize, self.compress = outuri, batchsize, compress
+		self.retries, self.timeout, self.journaldir = retries, timeout, journaldir
+		self.session = requests.Session()
+		if influxusername is not None:
+			self.session.auth = (influxusername, influxpassword)
+		# Statistics: points (lines) and batches written, batches spilled
+		self.points, self.batches, self.spilled = 0, 0, 0
+		# Set if a batch failed all retries, until a batch is accepted again
+		self.down = False
+
+	def write(self, influxdata, watermark=None):
+		"""
+		Write line protocol entries `influxdata` (any iterable) in batches.
+		Returns True if all batches were accepted by influxdb. If influxdb is
+		down and there is no journal, returns False right away. If `watermark`
+		(Watermark) is given, it is updated after each batch accepted or
+		spilled to the journal, and writing stops at the first batch that is
+		lost, such that a next run continues from there.
+		"""
+		ok = True
+		for batch in chunks(influxdata, self.batchsize):
+			# After one batch failed all retries, assume influxdb is down and
+			# spill the remaining batches directly.
+			if self.down and self.journaldir:
+				self.spill(batch)
+				ok = False
+			elif not self.post(batch):
+				if self.down and not self.journaldir:
+					# Remaining batches would be dropped as well, after retrying
+					# each of them, so stop here
+					my_logger.error("Influxdb is down and no journal configured, not writing remaining data")
+					if watermark is not None:
+						watermark.skip(len(batch))
+					return False
+				if self.down:
+					self.spill(batch)
+				elif watermark is not None:
+					# Batch is lost, keep watermark of its stations before it
+					my_logger.error("Not writing remaining data, a next run continues from the watermark")
+					watermark.skip(len(batch))
+					return False
+				ok = False
+			if watermark is not None:
+				watermark.update(len(batch))
+		return ok
+
+	def post(self, batch):
+		"""
+		Post one batch (list of entries), return True if accepted.
+		"""
+		body = "\n".join(batch).encode()
+		headers = {'Content-Type': 'text/plain; charset=utf-8'}
+		if self.compress:
+			body = gzip.compress(body, compresslevel=1)
+			headers['Content-Encoding'] = 'gzip'
+
+		for attempt in range(self.retries+1):
+			delay = RETRYBACKOFF * 2**attempt
+			try:
+				r = self.session.post(self.outuri, data=body, headers=headers, timeout=self.timeout)
+			except requests.RequestException as e:
+				my_logger.warning("Could not push to influxdb (attempt {}): {}".format(attempt+1, e))
+			else:
+				if r.status_code == 204:
+					my_logger.debug("Query successfully handed to influxdb.")
+					self.points += sum(entry.count("\n")+1 for entry in batch)
+					self.batches += 1
+					# Influxdb is back (e.g. during replay())
+					self.down = False
+					return True
+				if r.status_code != 429 and r.status_code < 500:
+					# Not retryable, e.g. malformed data or bad credentials
+					my_logger.error("Could not push to influxdb: {} - {}".format(r.status_code, r.content))
+					return False
+				my_logger.warning("Could not push to influxdb (attempt {}): {} - {}".format(attempt+1, r.status_code, r.content))
+				# Honour server's backoff request if given in seconds
+				if r.headers.get('Retry-After', '').isdigit():
+					delay = max(delay, int(r.headers['Retry-After']))
+			if attempt < self.retries:
+				time.sleep(delay)
+
+		my_logger.error("Could not push to influxdb after {} attempts".format(self.retries+1))
+		self.down = True
+		return False
+
+	def spill(self, batch):
+		"""
+		Store failed batch in journal directory, if configured.
+		"""
+		if not self.journaldir:
+			return
+		os.makedirs(self.journaldir, exist_ok=True)
+		fname = os.path.join(self.journaldir, "{:.6f}-{}.lp.gz".format(time.time(), os.getpid()))
+		write_atomic(fname, "\n".join(batch), gzip.open, 'wt')
+		self.spilled += 1
+		my_logger.warning("Spilled batch of {} entries to {}".format(len(batch), fname))
+
+	def replay(self):
+		"""
+		Write batches from journal directory (oldest first), remove those that
+		succeeded. Stop at the first failure, keeping it for a next run.
+		Returns True if the journal is empty afterwards.
+		"""
+		if not self.journaldir or not os.path.isdir(self.journaldir):
+			return True
+		for fname in sorted(f for f in os.listdir(self.journaldir) if f.endswith(".lp.gz")):
+			path = os.path.join(self.journaldir, fname)
+			with gzip.open(path, 'rt') as fd:
+				batch = fd.read().split("\n")
+			if not self.post(batch):
+				my_logger.error("Could not replay journal {}, keeping it".format(path))
+				return False
+			os.remove(path)
+			my_logger.info("Replayed journal {}".format(path))
+		return True
+
+class Watermark:
+	"""
+	Keep track of the last timestamp per station written to output `target`
+	in state file `statefile` (JSON, shared by all targets), such that an
+	interrupted run can be resumed. filter() drops KNMI hourly data rows
+	that were already written and queues the (station, timestamp) of the
+	others, update() is called with the number of entries acknowledged by
+	the output, which are assumed to be converted from the queued rows in
+	order, one entry per row.
+	"""
+	def __init__(self, statefile, target):
+		self.statefile, self.target = statefile, target
+		self.pending = collections.deque()
+		self.held = set()
+		self.state = {}
+		if os.path.exists(statefile):
+			with open(statefile) as fd:
+				self.state = json.load(fd)
+		self.stations = {int(stn): ts for stn, ts in self.state.get(target, {}).items()}
+
+	def histrange(self, knmistation, histrange):
+		"""
+		Get `histrange` for station(s) `knmistation` with start moved to the
+		day of the earliest watermark of these stations, if all have one.
+		"""
+		histstart, histend = parse_histrange(histrange)
+		stations = parse_stations(knmistation)
+		if stations == 'all' or not all(stn in self.stations for stn in stations):
+			return histstart, histend
+		# Timestamp of HH=24 is at 00:00 the next day, so subtract an hour
+		wmday = datetime.datetime.fromtimestamp(min(self.stations[stn] for stn in stations) - 3600, datetime.timezone.utc).strftime("%Y%m%d")
+		histstart = min(max(histstart, wmday), histend)
+		my_logger.info("Watermark: resuming {} from {}".format(self.target, histstart))
+		return histstart, histend
+
+	def filter(self, knmidata):
+		"""
+		Yield lines of KNMI hourly data `knmidata`, without data rows up to
+		the watermark of their station.
+		"""
+		start = False
+		daystart = {}
+		skipped = 0
+		for r in knmidata:
+			if not start or r[:1] == "#" or ',' not in r:
+				start = start or (r[:1] == "#" and "YYYYMMDD" in r)
+				yield r
+				continue
+			stn, yyyymmdd, hh = (c.strip() for c in r.split(',', 3)[:3])
+			if yyyymmdd not in daystart:
+				daystart[yyyymmdd] = int(datetime.datetime.strptime(yyyymmdd, "%Y%m%d").replace(tzinfo=datetime.timezone.utc).timestamp())
+			stn, ts = int(stn), daystart[yyyymmdd] + int(hh)*3600
+			if ts <= self.stations.get(stn, -1):
+				skipped += 1
+				continue
+			self.pending.append((stn, ts))
+			yield r
+		if skipped:
+			my_logger.info("Watermark: skipped {} rows already written to {}".format(skipped, self.target))
+
+	def update(self, nentries):
+		"""
+		Set watermark to the next `nentries` queued rows and save state.
+		Stations of rows that were skipped before are held back.
+		"""
+		for _ in range(nentries):
+			stn, ts = self.pending.popleft()
+			if stn not in self.held:
+				self.stations[stn] = max(ts, self.stations.get(stn, ts))
+		self.save()
+
+	def skip(self, nentries):
+		# Entries that were not written, keep watermark of their stations
+		# where it is, other stations can still advance
+		for _ in range(nentries):
+			self.held.add(self.pending.popleft()[0])
+
+	def save(self):
+		self.state[self.target] = {str(stn): ts for stn, ts in sorted(self.stations.items())}
+		write_atomic(self.statefile, json.dumps(self.state, indent=1))
+
+def open_output(outuri, append=False):
+	"""
+	Open file `outuri` to write text to, compressed with gzip if it ends in
+	.gz or with zstd if it ends in .zst (requires zstandard module).
+	"""
+	mode = 'a' if append else 'w'
+	if outuri.endswith('.gz'):
+		return gzip.open(outuri, mode + 't', compresslevel=6)
+	if outuri.endswith('.zst'):
+		import zstandard
+		# Appended zstd frames are read back as one stream
+		writer = zstandard.ZstdCompressor().stream_writer(open(outuri, mode + 'b'))
+		return io.TextIOWrapper(writer, encoding='utf-8')
+	return open(outuri, mode if append else 'w+')
+
+# Output file extensions for columns_output()
+COLUMNSEXT = ('.parquet', '.arrow', '.feather')
 
-def influxdb_output(outuri, influxdata, influxusername=None, influxpassword=None):
-	my_logger.debug("influxdb_output(outuri={}, influxdata)".format(outuri))
+def columns_output(outuri, columns):
+	"""
+	Write KNMI data `columns` (see knmi_columns()) to Parquet (if `outuri`
+	ends in .parquet) or Arrow IPC (.arrow, .feather) file `outuri`, one
+	row per observation with empty values as nulls. Requires pyarrow.
+	"""
+	my_logger.debug("columns_output(outuri={}, columns)".format(outuri))
+	import numpy as np
+	import pyarrow as pa
+
+	# Timestamp and station first, then the observations
+	names = ['DATETIME'] + [fname for fname in KNMIFIELDS if fname not in ('YYYYMMDD', 'HH')]
+	arrays = [pa.array(columns['DATETIME'].filled(0).astype('datetime64[s]'), type=pa.timestamp('s', tz='UTC'))]
+	for fname in names[1:]:
+		col = np.ma.asarray(columns[fname])
+		arrays.append(pa.array(col.data, mask=np.ma.getmaskarray(col)))
+	table = pa.Table.from_arrays(arrays, names=names)
+
+	if outuri.endswith('.parquet'):
+		import pyarrow.parquet
+		pyarrow.parquet.write_table(table, outuri, compression='zstd')
+	else:
+		import pyarrow.feather
+		pyarrow.feather.write_feather(table, outuri)
+	return True
+
+def influxdb_output(outuri, influxdata, influxusername=None, influxpassword=None, chunksize=None, journaldir=None, compress=True, watermark=None, append=False):
+	"""
+	Write line protocol entries `influxdata` (any iterable) to influxdb
+	server or file `outuri`. If `chunksize` is given, write at most that many
+	entries at once, such that `influxdata` can be a generator and memory
+	use is bounded. See InfluxWriter for `journaldir` and `compress`. Files
+	are compressed depending on their extension, see open_output(). Files
+	are appended to instead of overwritten if `append` is set, or if
+	`watermark` (Watermark) is given, which is updated after each written
+	chunk.
+	"""
+	my_logger.debug("influxdb_output(outuri={}, influxdata, chunksize={})".format(outuri, chunksize))
 	if (outuri[:4].lower() == 'http'):
-		r = requests.post(outuri, data="\n".join(influxdata), timeout=10, auth=(influxusername, influxpassword))
-		if r.status_code == 204:
-			my_logger.debug("Query successfully handed to influxdb.")
-		else:
-			my_logger.error("Could not push to influxdb: {} - {}".format(r.status_code, r.content))
+		# Reuse writer (and its connections) when called repeatedly, e.g. in
+		# daemon mode
+		key = (outuri, influxusername, influxpassword, chunksize, compress, journaldir)
+		if key not in _influxwriters:
+			_influxwriters[key] = InfluxWriter(outuri, influxusername, influxpassword, batchsize=chunksize or INFLUXBATCHSIZE, compress=compress, journaldir=journaldir)
+		writer = _influxwriters[key]
+		# Write data from previous failed runs first
+		writer.replay()
+		return writer.write(influxdata, watermark=watermark)
 	else:
-		# Store to file
-		with open(outuri, 'w+') as fdo:
-			fdo.write("\n".join(influxdata))
+		# Store to file, append when resuming such that earlier data is kept
+		append = (append or watermark is not None) and os.path.exists(outuri) and os.path.getsize(outuri) > 0
+		with open_output(outuri, append) as fdo:
+			if chunksize is None and watermark is None and not append:
+				fdo.write("\n".join(influxdata))
+				return True
+			# Write newline-separated, without trailing newline, as above
+			sep = "\n" if append else ""
+			for chunk in chunks(influxdata, chunksize or INFLUXBATCHSIZE):
+				fdo.write(sep + "\n".join(chunk))
+				sep = "\n"
+				if watermark is not None:
+					fdo.flush()
+					watermark.update(len(chunk))
+		return True
 
 def get_secrets(secretsfile):
 	"""
 	Get secrets from YAML file `secretsfile` as alternative to command line arguments
 	"""
+	import yaml
 
 	with open(secretsfile, 'r') as stream:
 		try:
@@ -400,87 +1765,393 @@ def get_secrets(secretsfile):
 	return KNMIAPIKEY, INFLUX_USER, INFLUX_PASSWD
 
 
+class RunMetrics:
+	"""
+	Measure wall time and number of rows, bytes and points per stage of a
+	run (e.g. fetch, convert, output). Time spent in a nested stage is only
+	counted for the nested stage, such that lazily evaluated stages (e.g.
+	with --stream) are measured separately. If `profile` is given, that
+	stage is profiled using cProfile (see `profiler`).
+	"""
+	def __init__(self, profile=None):
+		self.start = time.time()
+		self.stats = {}
+		self.stack = []
+		self.profile, self.profiler, self.profiling = profile, None, False
+		if profile is not None:
+			import cProfile
+			self.profiler = cProfile.Profile()
+
+	def add(self, stage, seconds=0, rows=0, bytes=0, points=0):
+		st = self.stats.setdefault(stage, {'seconds': 0, 'rows': 0, 'bytes': 0, 'points': 0})
+		st['seconds'] += seconds
+		st['rows'] += rows
+		st['bytes'] += bytes
+		st['points'] += points
+
+	def _enter(self, stage):
+		self.stack.append((stage, time.perf_counter()))
+		self._profile()
+
+	def _exit(self):
+		stage, t0 = self.stack.pop()
+		dt = time.perf_counter() - t0
+		self.add(stage, seconds=dt)
+		if self.stack:
+			self.add(self.stack[-1][0], seconds=-dt)
+		self._profile()
+
+	def _profile(self):
+		# Only profile while the profiled stage is the innermost stage
+		active = bool(self.stack) and self.stack[-1][0] == self.profile
+		if self.profiler is not None and active != self.profiling:
+			if active:
+				self.profiler.enable()
+			else:
+				self.profiler.disable()
+			self.profiling = active
+
+	@contextlib.contextmanager
+	def stage(self, stage):
+		"""
+		Context manager measuring time spent in `stage`.
+		"""
+		self._enter(stage)
+		try:
+			yield
+		finally:
+			self._exit()
+
+	def iterate(self, stage, iterable, count='points'):
+		"""
+		Yield items of `iterable`, measuring time spent getting them in
+		`stage`, and counting them as `count`: 'rows' (with their length as
+		bytes), or 'points' (line protocol entries).
+		"""
+		iterator = iter(iterable)
+		while True:
+			self._enter(stage)
+			try:
+				item = next(iterator)
+			except StopIteration:
+				return
+			finally:
+				self._exit()
+			if count == 'rows':
+				self.add(stage, rows=1, bytes=len(item)+1)
+			else:
+				self.add(stage, points=item.count("\n")+1)
+			yield item
+
+	def lines(self, mode):
+		"""
+		Get measurements as influxdb line protocol entries (measurement
+		knmi2influxdb_run, time in seconds), one per stage plus total.
+		"""
+		stats = dict(self.stats)
+		stats['total'] = {'seconds': time.time() - self.start}
+		outlines = []
+		for stage, st in stats.items():
+			fields = ['seconds={:.6f}'.format(st['seconds'])] + ['{}={}i'.format(f, st[f]) for f in ('rows', 'bytes', 'points') if st.get(f)]
+			outlines.append("knmi2influxdb_run,mode={},stage={} {} {}".format(mode, stage, ",".join(fields), int(self.start)))
+		return outlines
+
+	def dump_profile(self, filename):
+		# Write cProfile statistics to `filename`
+		self.profiler.dump_stats(filename)
+		my_logger.info("Wrote conversion profile to {}".format(filename))
+
+	def log(self, mode):
+		for stage, st in self.stats.items():
+			my_logger.info("{} {}: {:.3f}s, {} rows, {} bytes, {} points".format(mode, stage, st['seconds'], st['rows'], st['bytes'], st['points']))
+
+def run(args, mode=None, filename=None):
+	"""
+	Get, convert and output data once for `mode` ('actual' or 'historical',
+	default args.time) using command line arguments `args`. For actual data,
+	use data file `filename` if given instead of the latest one.
+	"""
+	mode = mode or args.time
+	metrics = RunMetrics(profile='convert' if args.profile else None)
+	if (args.profile and ((mode == 'historical' and (args.processes or args.pipeline)) or (mode == 'actual' and args.backfill))):
+		# cProfile only sees this thread
+		my_logger.warning("Conversion runs in other processes or threads, profile does not cover it.")
+	influxdata=None
+	watermark=None
+	rollups=[]
+	columnar = args.outuri is not None and args.outuri.lower().endswith(COLUMNSEXT)
+	if (mode == 'historical'):
+		histrange = args.histrange
+		rollup = args.rollup and not columnar
+		if (rollup and (args.pipeline or args.stream)):
+			my_logger.warning("Rollups need all data at once, not available with --pipeline or --stream.")
+			rollup = False
+		if (args.statefile and args.outuri and not columnar):
+			# Resume after data already written to this output
+			watermark = Watermark(args.statefile, args.outuri)
+			if (not rollup):
+				histrange = watermark.histrange(args.station, histrange)
+		if (rollup):
+			# Get whole weeks of the full range also when resuming, such that
+			# all rollups are complete, the watermark still skips written rows
+			histrange = rollup_histrange(histrange)
+		if (args.pipeline and not columnar):
+			# Fetch and convert in background threads while writing
+			influxdata = get_knmi_data_historical_pipeline(args.station, histrange, args.query, windowdays=args.window or 31, workers=args.workers, retries=args.retries, parser=args.parser, cachedir=args.cachedir, cachemaxage=args.cachemaxage, watermark=watermark)
+			influxdata = metrics.iterate('pipeline', influxdata, 'points')
+		else:
+			if (args.stream and (args.cachedir or args.window)):
+				my_logger.warning("--window and --cachedir get all data at once, not streaming. Use --pipeline to limit memory use.")
+			with metrics.stage('fetch'):
+				if (args.cachedir):
+					maxsize = args.cachesize*1024*1024 if args.cachesize is not None else None
+					knmidata = get_knmi_data_historical_cached(args.station, histrange, args.cachedir, maxage=args.cachemaxage, maxsize=maxsize, windowdays=args.window, workers=args.workers if args.window else 1, retries=args.retries)
+				elif (args.window):
+					knmidata = get_knmi_data_historical_parallel(args.station, histrange, windowdays=args.window, workers=args.workers, retries=args.retries)
+				else:
+					knmidata = get_knmi_data_historical(args.station, histrange, stream=args.stream)
+			if isinstance(knmidata, list):
+				metrics.add('fetch', rows=len(knmidata), bytes=sum(len(l)+1 for l in knmidata))
+			else:
+				# Streamed, data is read while converting
+				knmidata = metrics.iterate('fetch', knmidata, 'rows')
+			if (rollup):
+				with metrics.stage('rollup'):
+					rollups = rollup_knmi(knmidata)
+			if (watermark):
+				knmidata = watermark.filter(knmidata)
+			with metrics.stage('convert'):
+				if (columnar):
+					# Export observations as is, without query
+					influxdata = knmi_columns(knmidata)
+				elif (args.processes):
+					influxdata = iter_convert_knmi_parallel(knmidata, args.query, processes=args.processes, parser=args.parser)
+					if (not args.stream):
+						influxdata = list(influxdata)
+				elif (args.stream):
+					if (args.parser == 'columnar'):
+						my_logger.warning("Columnar parser needs all data at once, using row parser for streaming.")
+					influxdata = iter_convert_knmi(knmidata, args.query)
+				elif (args.parser == 'columnar'):
+					influxdata = convert_knmi_columnar(knmidata, args.query)
+				else:
+					influxdata = convert_knmi(knmidata, args.query)
+			if (columnar):
+				with metrics.stage('output'):
+					columns_output(args.outuri, influxdata)
+				metrics.log(mode)
+				if (args.profile):
+					metrics.dump_profile(args.profile)
+				return
+			if isinstance(influxdata, list):
+				metrics.add('convert', points=sum(entry.count("\n")+1 for entry in influxdata))
+			else:
+				influxdata = metrics.iterate('convert', influxdata, 'points')
+	else:
+		if (columnar):
+			my_logger.error("Parquet and Arrow output is only supported for historical data.")
+			return
+		if (not args.api_key):
+			logging.error("Need apikey for actual data query.")
+		rollupstate=None
+		if (args.rollup):
+			if (args.backfill or not args.rollupstate):
+				my_logger.warning("Rollups of actual data need --rollupstate, and are not available with --backfill.")
+			else:
+				rollupstate = RollupState(args.rollupstate)
+		if (args.backfill):
+			influxdata = get_knmi_data_actual_backfill(args.api_key, args.station, args.query, args.histrange, workers=args.workers, processes=args.processes, cachedir=args.cachedir)
+			# Downloads and conversion run concurrently, measure as one stage
+			influxdata = metrics.iterate('backfill', influxdata, 'points')
+		else:
+			influxdata = get_knmi_data_actual(args.api_key, args.station, args.query, filename=filename, cachedir=args.cachedir, metrics=metrics, rollupstate=rollupstate)
+
+	with metrics.stage('output'):
+		if (args.outuri):
+			influxdb_output(args.outuri, influxdata, influxusername=args.influxusername, influxpassword=args.influxpassword, chunksize=args.batchsize, journaldir=args.journaldir, compress=not args.nogzip, watermark=watermark)
+		elif (args.stream or args.backfill or args.pipeline):
+			for outline in influxdata:
+				print (outline)
+		else:
+			print (influxdata)
+
+	if (mode == 'actual' and args.cachedir):
+		# Files are only used again by --backfill, keep recent ones only
+		maxsize = args.cachesize*1024*1024 if args.cachesize is not None else None
+		cache_evict(args.cachedir, 'actual', maxsize, ACTUALCACHEMAXAGE)
+
+	metrics.log(mode)
+	if (args.profile):
+		metrics.dump_profile(args.profile)
+	# Write after the data, such that output time is complete
+	extra = rollups + (metrics.lines(mode) if args.selfmetrics else [])
+	if (extra and args.outuri):
+		influxdb_output(args.outuri, extra, influxusername=args.influxusername, influxpassword=args.influxpassword, journaldir=args.journaldir, compress=not args.nogzip, append=True)
+	elif (extra):
+		print ("\n".join(extra))
+
+def next_actual(now, offset):
+	"""
+	Get time of next actual data poll after `now`, `offset` seconds after a
+	10-minute boundary, when KNMI should have published the new file.
+	"""
+	return (now - offset)//600*600 + 600 + offset
+
+def next_historical(now, histtime):
+	"""
+	Get time of next historical data run after `now`, daily at `histtime`
+	(HH:MM, local time).
+	"""
+	hour, minute = (int(x) for x in histtime.split(':'))
+	nextrun = datetime.datetime.fromtimestamp(now).replace(hour=hour, minute=minute, second=0, microsecond=0)
+	if nextrun.timestamp() <= now:
+		nextrun += datetime.timedelta(days=1)
+	return nextrun.timestamp()
+
+def daemon(args):
+	"""
+	Keep running and get actual data every 10 minutes and historical data
+	once a day, reusing loaded modules and HTTP connections instead of
+	starting a new process every time.
+	"""
+	my_logger.info("Starting daemon, actual data at {}s after every 10 minutes, historical data daily at {}".format(args.actualoffset, args.histtime))
+	jobs = {'historical': next_historical(time.time(), args.histtime)}
+	if (args.api_key):
+		# Get latest actual data right away
+		jobs['actual'] = time.time()
+	else:
+		my_logger.warning("No apikey given, not getting actual data.")
+	lastfile = None
+
+	while True:
+		mode, when = min(jobs.items(), key=lambda job: job[1])
+		time.sleep(max(0, when - time.time()))
+		try:
+			if (mode == 'actual'):
+				filename = get_knmi_latest_filename(args.api_key)
+				if (filename == lastfile):
+					# New file not available yet, try again soon, but not
+					# later than the next regular poll.
+					my_logger.debug("No new actual data file yet, latest is {}".format(filename))
+					jobs['actual'] = min(time.time() + ACTUALRETRY, next_actual(time.time(), args.actualoffset))
+					continue
+				run(args, 'actual', filename)
+				lastfile = filename
+			else:
+				run(args, 'historical')
+		except Exception:
+			# Keep running, next run might work again
+			my_logger.exception("Daemon {} run failed".format(mode))
+		if (mode == 'actual'):
+			jobs['actual'] = next_actual(time.time(), args.actualoffset)
+		else:
+			jobs['historical'] = next_historical(time.time(), args.histtime)
+
 # Init logger, defaults to console
 my_logger = logging.getLogger("MyLogger")
 my_logger.setLevel(logging.DEBUG)
 
-# create syslog handler which also shows filename in log
-handler_syslog = logging.handlers.SysLogHandler(address = '/dev/log')
-formatter = logging.Formatter('%(filename)s: %(message)s')
-handler_syslog.setFormatter(formatter)
-handler_syslog.setLevel(logging.INFO)
-my_logger.addHandler(handler_syslog)
-
-my_logger.debug("Init logging & parsing command line args.")
-
-# Parse commandline arguments
-parser = argparse.ArgumentParser(description="Convert KNMI data to influxdb line protocol. Optionally insert into database directly")
-parser.add_argument("--time", choices=['actual', 'historical'], help="Get actual (default, updated in 10-min interval) or historical (hourly, updated daily) data. ", default='actual')
-parser.add_argument("--histrange", help="Time range to get historical data for. Either days since now (if one parameter), or timerange in format of YYYYMMDD (if two parameters)", nargs="*", default=['21'])
-parser.add_argument("--station", help="""KNMI station (default: de Bilt). Possible values:
-	210: Valkenburg
-	215: Voorschoten
-	225: IJmuiden
-	235: De Kooy
-	240: Schiphol
-	242: Vlieland
-	249: Berkhout
-	251: Hoorn (Terschelling)
-	257: Wijk aan Zee
-	258: Houtribdijk
-	260: De Bilt
-	265: Soesterberg
-	267: Stavoren
-	269: Lelystad
-	270: Leeuwarden
-	273: Marknesse
-	275: Deelen
-	277: Lauwersoog
-	278: Heino
-	279: Hoogeveen
-	280: Eelde
-	283: Hupsel
-	286: Nieuw Beerta
-	290: Twenthe
-	310: Vlissingen
-	319: Westdorpe
-	323: Wilhelminadorp
-	330: Hoek van Holland
-	340: Woensdrecht
-	344: Rotterdam
-	348: Cabauw
-	350: Gilze-Rijen
-	356: Herwijnen
-	370: Eindhoven
-	375: Volkel
-	377: Ell
-	380: Maastricht
-	391: Arcen""", default=260)
-parser.add_argument("--api_key", help="KNMI opendata api key, required for actuals.")
-parser.add_argument("--outuri", help="Output target, either influxdb server (if starts with http, e.g. http://localhost:8086/write?db=smarthome&precision=s), or filename (else)")
-parser.add_argument("--influxusername", help="Influxdb username (if outuri points to influxdb server)")
-parser.add_argument("--influxpassword", help="Influxdb password (if outuri points to influxdb server)")
-parser.add_argument("--secretsfile", help="YAML file containing secrets, e.g. KNMI API & Influddb authentication.")
-parser.add_argument("--query", help="Query template for influxdb line protocol, where {DATETIME}=UT date in seconds since epoch, {STN}=station, {T}=temp in C, {FF}=windspeed in m/s, {FX}=windgust in m/s, {DD}=wind direction in deg, {Q}=irradiance in W/m^2, {RH}=precipitation in mm, {NEWLINE} is newline, e.g. 'weather,device=knmi temp={T} wind={DD}'", default=DEFAULTQUERY)
-args = parser.parse_args()
-
-logging.debug("Got command line args:" + str(args))
-
-# Load secrets
-if (args.secretsfile):
-	args.api_key, args.influxusername, args.influxpassword = get_secrets(args.secretsfile)
-
-influxdata=None
-if (args.time == 'historical'):
-	knmidata = get_knmi_data_historical(args.station, args.histrange)
-	influxdata = convert_knmi(knmidata, args.query)
-else:
-	if (not args.api_key):
-		logging.error("Need apikey for actual data query.")
-	influxdata = get_knmi_data_actual(args.api_key, args.station, args.query)
-
-if (args.outuri):
-	influxdb_output(args.outuri, influxdata, influxusername=args.influxusername, influxpassword=args.influxpassword)
-else:
-	print (influxdata)
-# Run for live data
\ No newline at end of file
+def get_parser():
+	"""
+	Get command line argument parser.
+	"""
+	parser = argparse.ArgumentParser(description="Convert KNMI data to influxdb line protocol. Optionally insert into database directly")
+	parser.add_argument("--time", choices=['actual', 'historical'], help="Get actual (default, updated in 10-min interval) or historical (hourly, updated daily) data. ", default='actual')
+	parser.add_argument("--histrange", help="Time range to get historical data for. Either days since now (if one parameter), or timerange in format of YYYYMMDD (if two parameters)", nargs="*", default=['21'])
+	parser.add_argument("--station", nargs="+", help="""KNMI station(s), or 'all' for all stations (default: de Bilt). Possible values:
+		210: Valkenburg
+		215: Voorschoten
+		225: IJmuiden
+		235: De Kooy
+		240: Schiphol
+		242: Vlieland
+		249: Berkhout
+		251: Hoorn (Terschelling)
+		257: Wijk aan Zee
+		258: Houtribdijk
+		260: De Bilt
+		265: Soesterberg
+		267: Stavoren
+		269: Lelystad
+		270: Leeuwarden
+		273: Marknesse
+		275: Deelen
+		277: Lauwersoog
+		278: Heino
+		279: Hoogeveen
+		280: Eelde
+		283: Hupsel
+		286: Nieuw Beerta
+		290: Twenthe
+		310: Vlissingen
+		319: Westdorpe
+		323: Wilhelminadorp
+		330: Hoek van Holland
+		340: Woensdrecht
+		344: Rotterdam
+		348: Cabauw
+		350: Gilze-Rijen
+		356: Herwijnen
+		370: Eindhoven
+		375: Volkel
+		377: Ell
+		380: Maastricht
+		391: Arcen""", default=[KNMISTATION])
+	parser.add_argument("--parser", choices=['rows', 'columnar'], help="Parse historical data row by row (default), or all at once using numpy (faster for large datasets)", default='rows')
+	parser.add_argument("--stream", action='store_true', help="Stream historical data from KNMI through conversion to output in chunks, such that memory use does not grow with --histrange. Not compatible with --parser columnar, --window or --cachedir, see --pipeline for these.")
+	parser.add_argument("--window", type=int, help="Split historical time range in windows of this many days, which are fetched concurrently (e.g. 31 for multi-year ranges)")
+	parser.add_argument("--workers", type=int, help="Number of concurrent requests when using --window or --backfill (default: 4)", default=4)
+	parser.add_argument("--retries", type=int, help="Number of retries per window when using --window (default: 3)", default=3)
+	parser.add_argument("--pipeline", action='store_true', help="Historical data: get data in windows of --window days (default: 31), and get, convert and write windows concurrently in a pipeline. Uses --workers concurrent requests")
+	parser.add_argument("--daemon", action='store_true', help="Keep running, get actual data every 10 minutes and historical data (--histrange) daily, instead of once")
+	parser.add_argument("--actualoffset", type=int, help="Daemon mode: seconds after each 10-minute boundary to get actual data, when the new file is available (default: 120)", default=120)
+	parser.add_argument("--histtime", help="Daemon mode: local time to get historical data daily as HH:MM (default: 12:00)", default="12:00")
+	parser.add_argument("--backfill", action='store_true', help="Actual data: get all 10-minute data files in --histrange instead of only the latest, e.g. to fill in missed runs. Uses --workers concurrent downloads")
+	parser.add_argument("--processes", type=int, help="Number of processes to convert data with. Actual data with --backfill: default number of CPUs, 0 for no extra processes. Historical data: split in shards of {} rows converted in parallel, default no extra processes".format(KNMISHARDROWS))
+	parser.add_argument("--cachedir", help="Directory to cache downloaded KNMI data, such that actual data files are downloaded only once, and historical data is only downloaded for days that are not cached or not final yet")
+	parser.add_argument("--cachemaxage", type=int, help="Seconds after which cached historical data of recent days (less than {} days old when cached) is downloaded again (default: {})".format(HISTCACHEFINAL, HISTCACHEMAXAGE), default=HISTCACHEMAXAGE)
+	parser.add_argument("--cachesize", type=int, help="Maximum size of historical and of actual data each in --cachedir in MB, least recently used files are removed first (default: no limit, but actual data files not used for {} days are removed)".format(ACTUALCACHEMAXAGE//86400))
+	parser.add_argument("--api_key", help="KNMI opendata api key, required for actuals.")
+	parser.add_argument("--outuri", help="Output target, either influxdb server (if starts with http, e.g. http://localhost:8086/write?db=smarthome&precision=s), or filename (else). Files ending in .gz or .zst are compressed. Historical data can also be exported as table without --query to .parquet or .arrow files (requires pyarrow)")
+	parser.add_argument("--influxusername", help="Influxdb username (if outuri points to influxdb server)")
+	parser.add_argument("--influxpassword", help="Influxdb password (if outuri points to influxdb server)")
+	parser.add_argument("--batchsize", type=int, help="Number of entries per influxdb write request or file write (default: {})".format(INFLUXBATCHSIZE), default=INFLUXBATCHSIZE)
+	parser.add_argument("--journaldir", help="Directory to store batches that could not be written to influxdb, these are written again on the next run")
+	parser.add_argument("--statefile", help="Historical data: file to keep the last timestamp written to --outuri per station, such that an interrupted run continues from there when run again")
+	parser.add_argument("--nogzip", action='store_true', help="Do not gzip-compress requests to influxdb")
+	parser.add_argument("--rollup", action='store_true', help="Also write daily and weekly aggregates per station (measurements knmi_daily and knmi_weekly, e.g. T_min, T_max, T_mean, RH_sum, Q_mean). Historical data: --histrange is extended to whole weeks. Actual data: requires --rollupstate")
+	parser.add_argument("--rollupstate", help="Actual data: file to keep rollups of the current periods in, which are updated with each new data file")
+	parser.add_argument("--selfmetrics", action='store_true', help="Write time, rows, bytes and points per stage (fetch, convert, output, ...) of each run to the output as measurement knmi2influxdb_run")
+	parser.add_argument("--profile", help="Write cProfile statistics of data conversion to this file, e.g. to view with python3 -m pstats. Does not cover conversion with --processes, --pipeline or --backfill")
+	parser.add_argument("--secretsfile", help="YAML file containing secrets, e.g. KNMI API & Influddb authentication.")
+	parser.add_argument("--query", help="Query template for influxdb line protocol, where {DATETIME}=UT date in seconds since epoch, {STN}=station, {T}=temp in C, {FF}=windspeed in m/s, {FX}=windgust in m/s, {DD}=wind direction in deg, {Q}=irradiance in W/m^2, {RH}=precipitation in mm, {NEWLINE} is newline, e.g. 'weather,device=knmi temp={T} wind={DD}'. For actual data, all variables in the KNMI data file can be used by name as well, e.g. {rh}=relative humidity in %%, {td}=dew point in C, {ww}=weather code", default=DEFAULTQUERY)
+	return parser
+
+def main(argv=None):
+	"""
+	Command line entry point, `argv` defaults to sys.argv[1:].
+	"""
+	# create syslog handler which also shows filename in log
+	if not any(isinstance(h, logging.handlers.SysLogHandler) for h in my_logger.handlers):
+		handler_syslog = logging.handlers.SysLogHandler(address = '/dev/log')
+		formatter = logging.Formatter('%(filename)s: %(message)s')
+		handler_syslog.setFormatter(formatter)
+		handler_syslog.setLevel(logging.INFO)
+		my_logger.addHandler(handler_syslog)
+
+	my_logger.debug("Init logging & parsing command line args.")
+	args = get_parser().parse_args(argv)
+
+	logging.debug("Got command line args:" + str(args))
+
+	# Load secrets
+	if (args.secretsfile):
+		args.api_key, args.influxusername, args.influxpassword = get_secrets(args.secretsfile)
+
+	if (args.daemon):
+		daemon(args)
+	else:
+		run(args)
+
+if __name__ == "__main__":
+	main()